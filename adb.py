@@ -0,0 +1,238 @@
+# adb.py
+# Small async helpers for talking to a device directly over ADB, for the
+# steps that do not need the agent: launching and stopping apps, going home,
+# replaying recorded taps and reading the screen's uiautomator hierarchy.
+# Commands go over a small pool of persistent `adb shell` sessions per
+# device, so dozens of small commands do not each spawn an adb process.
+
+import asyncio
+import os
+import re
+from xml.etree import ElementTree
+
+ADB = os.getenv("ADB", "adb")
+
+BOUNDS_RE = re.compile(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]")
+
+
+SESSIONS_PER_DEVICE = int(os.getenv("SMARTCAB_ADB_SESSIONS", "2"))
+
+
+def adb_args(serial, *args):
+    return [ADB] + (["-s", serial] if serial else []) + list(args)
+
+
+# ---------- Persistent shell sessions ----------
+
+class ShellSession:
+    # One long-lived `adb shell` process. Commands are written to its stdin
+    # one at a time; each is followed by a unique sentinel line carrying the
+    # exit status, which tells us where the command's output ends. A dead or
+    # wedged process is killed and replaced on the next command.
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.proc = None
+        self.lock = asyncio.Lock()
+        self.counter = 0
+
+    def alive(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    async def connect(self):
+        self.kill()
+        self.proc = await asyncio.create_subprocess_exec(
+            *adb_args(self.serial, "shell"),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc = None
+
+    async def _send(self, line):
+        if not self.alive():
+            await self.connect()
+        self.proc.stdin.write(line.encode())
+        await self.proc.stdin.drain()
+
+    async def _read_until(self, marker):
+        lines = []
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                raise ConnectionError("adb shell closed")
+            text = line.decode(errors="replace")
+            if text.startswith(marker):
+                out = "".join(lines)
+                # drop the newline printed in front of the sentinel
+                return out[:-1] if out.endswith("\n") else out, int(text[len(marker):].strip() or 0)
+            lines.append(text)
+
+    async def run(self, command, timeout=10):
+        async with self.lock:
+            self.counter += 1
+            marker = f"__SMARTCAB_{id(self)}_{self.counter}__"
+            line = f"{command}\nprintf '\\n{marker}%d\\n' $?\n"
+            try:
+                await self._send(line)
+            except (BrokenPipeError, ConnectionResetError):
+                # Connection dropped while idle: reconnect and send once more
+                await self.connect()
+                await self._send(line)
+
+            try:
+                return await asyncio.wait_for(self._read_until(marker), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError):
+                # Output of the interrupted command would leak into the next one
+                self.kill()
+                raise
+
+
+class ShellPool:
+    # A few sessions per device so a slow uiautomator dump does not hold up
+    # a tap; each command takes the first idle session.
+
+    def __init__(self, serial, size=SESSIONS_PER_DEVICE):
+        self.sessions = [ShellSession(serial) for _ in range(max(1, size))]
+        self.next = 0
+
+    def pick(self):
+        for session in self.sessions:
+            if not session.lock.locked():
+                return session
+        self.next = (self.next + 1) % len(self.sessions)
+        return self.sessions[self.next]
+
+    async def run(self, command, timeout=10):
+        return await self.pick().run(command, timeout)
+
+    def close(self):
+        for session in self.sessions:
+            session.kill()
+
+
+_pools = {}
+
+def pool_for(serial):
+    # Sessions belong to the event loop that created them (the runner loop)
+    pool = _pools.get(serial)
+    if pool is None:
+        pool = _pools[serial] = ShellPool(serial)
+    return pool
+
+
+def close_all():
+    for pool in _pools.values():
+        pool.close()
+    _pools.clear()
+
+
+async def shell(serial, command, timeout=10):
+    out, _ = await pool_for(serial).run(command, timeout)
+    return out
+
+
+# ---------- Device actions ----------
+
+FOCUS_RE = re.compile(r"mCurrentFocus=.*?\s([\w.]+)/")
+
+
+async def home(serial):
+    return await shell(serial, "input keyevent KEYCODE_HOME")
+
+
+async def force_stop(serial, package):
+    return await shell(serial, f"am force-stop {package}")
+
+
+async def foreground_package(serial):
+    out = await shell(serial, "dumpsys window | grep mCurrentFocus")
+    m = FOCUS_RE.search(out)
+    return m.group(1) if m else None
+
+
+async def launch(serial, package, timeout=10):
+    # Start (or bring back) the app's launcher activity and wait until it
+    # actually has focus. Returns False if it never came to the front.
+    await shell(serial, f"monkey -p {package} -c android.intent.category.LAUNCHER 1")
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        if await foreground_package(serial) == package:
+            return True
+        if asyncio.get_running_loop().time() >= deadline:
+            return False
+        await asyncio.sleep(0.3)
+
+
+async def tap(serial, x, y):
+    return await shell(serial, f"input tap {int(x)} {int(y)}")
+
+
+async def swipe(serial, x1, y1, x2, y2, duration_ms=300):
+    return await shell(serial, f"input swipe {int(x1)} {int(y1)} {int(x2)} {int(y2)} {int(duration_ms)}")
+
+
+async def keyevent(serial, keycode):
+    return await shell(serial, f"input keyevent {keycode}")
+
+
+async def input_text(serial, text):
+    # `input text` treats spaces as separators; %s is its escape for a space
+    escaped = "".join("\\" + c if c in "\\'\"`$&|;<>()*~!#?[]{}" else c for c in str(text))
+    return await shell(serial, "input text " + escaped.replace(" ", "%s"))
+
+
+async def open_url(serial, url, package=None):
+    # Fire a VIEW intent (deep link), optionally pinned to one app
+    target = f" {package}" if package else ""
+    quoted = "'" + url.replace("'", "'\\''") + "'"
+    return await shell(serial, f"am start -W -a android.intent.action.VIEW -d {quoted}{target}")
+
+
+async def dump_ui(serial):
+    out = await shell(serial, "uiautomator dump /sdcard/window_dump.xml >/dev/null && cat /sdcard/window_dump.xml", timeout=15)
+    start = out.find("<?xml")
+    return out[start:] if start >= 0 else ""
+
+
+def ui_nodes(xml):
+    # Flat list of the nodes in a uiautomator dump that carry text
+    nodes = []
+    if not xml:
+        return nodes
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError:
+        return nodes
+
+    for node in root.iter("node"):
+        text = node.get("text") or ""
+        desc = node.get("content-desc") or ""
+        if not text and not desc:
+            continue
+        m = BOUNDS_RE.match(node.get("bounds", ""))
+        bounds = tuple(int(v) for v in m.groups()) if m else (0, 0, 0, 0)
+        nodes.append({
+            "text": text,
+            "desc": desc,
+            "id": node.get("resource-id") or "",
+            "bounds": bounds,
+        })
+    return nodes
+
+
+def find_node(nodes, text):
+    wanted = text.strip().lower()
+    for node in nodes:
+        if wanted and (wanted in node["text"].lower() or wanted in node["desc"].lower()):
+            return node
+    return None
+
+
+def center(node):
+    x1, y1, x2, y2 = node["bounds"]
+    return (x1 + x2) // 2, (y1 + y2) // 2
@@ -1,24 +1,965 @@
 import asyncio
+import concurrent.futures
+import copy
 import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from droidrun import DroidAgent, DroidrunConfig
 
-async def run_task(goal: str):
-    config = DroidrunConfig()
+import adb
+import fare_extractor
+import macros
+from result_cache import ResultCache, ttl_for
+from utils import extract_json, missing_fields
+
+TIMINGS_PATH = os.getenv("SMARTCAB_TIMINGS") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "agent_timings.jsonl"
+)
+
+# Seconds a goal may run before it is stopped, per action
+DEFAULT_DEADLINES = {
+    "fetch": 180,
+    "book": 300,
+}
+DEFAULT_DEADLINE = 300
+
+DEEP_LINK_TIMEOUT = 12    # seconds for a deep link to show fares
+
+# A successful fetch leaves the app on its fare screen ("parked") instead of
+# going home, so booking the winner on the same device only has to bring
+# the app back and confirm. SMARTCAB_KEEP_FARE_SCREEN=0 restores going home.
+KEEP_FARE_SCREEN = os.getenv("SMARTCAB_KEEP_FARE_SCREEN", "1") != "0"
+PARK_MAX_AGE = 300        # seconds a parked fare screen is trusted
+RESUME_TIMEOUT = 5        # seconds for a resumed app to show its fares
+
+# Closing instruction for goals that read a price list
+RETURN_ARRAY = """DO NOT use remember().
+Instead, return the JSON array directly as the reason in complete().
+
+Return ONLY the JSON array text.
+"""
+
+
+def deadline_for(key):
+    if key is None:
+        return DEFAULT_DEADLINE
+    return DEFAULT_DEADLINES.get(key[1], DEFAULT_DEADLINE)
+
+
+def time_left(ends):
+    return max(0.0, ends - time.monotonic())
+
+
+async def run_task(goal: str, config=None, key=None, deadline=None, record=False, package=None, fields=(),
+                   vision=False):
+    # Starts on the accessibility tree alone unless vision is asked for,
+    # forced, or the tree has nothing to read; a text-only fetch that gets
+    # stuck is run again with screenshots for whatever time is left. Other
+    # goals (bookings) are never re-run: the first attempt may have booked.
+    config = config or DroidrunConfig()
+    serial = getattr(config.device, "serial", None)
+    vision = vision or VISION_FORCED
+    if not vision and await tree_is_empty(serial):
+        print("Accessibility tree is empty, starting with vision")
+        vision = True
+
+    started = time.monotonic()
+    result = await run_attempt(goal, with_vision(config, vision), key, deadline, record, package, fields)
+    result["vision"] = vision
+    retry_safe = key is not None and key[1] == "fetch"
+    if vision or not retry_safe or not is_stuck(result, config):
+        return result
+
+    remaining = deadline - (time.monotonic() - started) if deadline else None
+    if remaining is not None and remaining < VISION_MIN_REMAINING:
+        return result
+    print("Agent stuck on the accessibility tree, retrying with vision:", result["raw_reason"])
+    result = await run_attempt(goal, with_vision(config, True), key, remaining, record, package, fields)
+    result["vision"] = "escalated"
+    return result
+
+
+async def run_attempt(goal, config, key=None, deadline=None, record=False, package=None, fields=()):
+    if record:
+        config = copy.deepcopy(config)
+        config.logging.save_trajectory = "action"
+    serial = getattr(config.device, "serial", None)
     agent = DroidAgent(goal=goal, config=config)
-    result = await agent.run()
+    timer = StepTimer()
 
-    parsed = None
-    if result.reason:
-        try:
-            parsed = json.loads(result.reason)
-        except:
-            parsed = None
+    handler = agent.run()
+
+    async def drive():
+        async for event in handler.stream_events():
+            timer.mark(event)
+        return await handler
+
+    try:
+        result = await asyncio.wait_for(drive(), deadline)
+    except asyncio.TimeoutError:
+        await stop_agent(handler, serial, package)
+        timing = timer.summary()
+        write_timing(key, serial, False, timing)
+        return {
+            "success": False,
+            "status": "timeout",
+            "json": None,
+            "raw_reason": f"Timed out after {deadline}s",
+            "timing": timing
+        }
+    except asyncio.CancelledError:
+        await asyncio.shield(stop_agent(handler, serial, package))
+        raise
+
+    # Recovers records from prose, code fences or truncated output
+    parsed, report = extract_json(result.reason, fields)
+
+    timing = timer.summary(getattr(result, "steps", None))
+    write_timing(key, serial, result.success, timing)
 
     return {
         "success": result.success,
+        "status": "ok" if result.success else "failed",
         "json": parsed,
-        "raw_reason": result.reason
+        "raw_reason": result.reason,
+        "partial": report["partial"],
+        "missing_fields": report["missing"],
+        "timing": timing
+    }
+
+
+def is_good(result):
+    return result["success"] and result["json"] is not None
+
+
+def is_complete(result):
+    return is_good(result) and not result.get("partial") and not result.get("missing_fields")
+
+
+async def run_goal(task, config):
+    # Launching the app and going home are plain ADB calls around the agent
+    # run; the goal text itself no longer asks the agent to do them.
+    # The task's deadline covers every step of it (deep link, macro replay,
+    # agent runs); each agent run gets whatever time is left.
+    serial = config.device.serial
+    key = task["key"]
+    timer = StepTimer()
+    ends = time.monotonic() + task["deadline"]
+
+    if task["resume_goal"]:
+        result = await resume_booking(task, config, ends)
+        if result is not None:
+            return result
+
+    # A good fetch stays on its fare screen for a later booking
+    parked = False
+    try:
+        try:
+            result = await asyncio.wait_for(open_and_navigate(task, config, ends), time_left(ends))
+        except asyncio.TimeoutError:
+            timing = timer.summary()
+            write_timing(key, serial, False, timing)
+            result = {
+                "success": False,
+                "status": "timeout",
+                "json": None,
+                "raw_reason": f"Timed out after {task['deadline']}s",
+                "timing": timing
+            }
+        parked = KEEP_FARE_SCREEN and key is not None and key[1] == "fetch" and is_good(result)
+        result["parked"] = parked
+        return result
+    finally:
+        if task["go_home"] and not parked:
+            try:
+                await adb.home(serial)
+            except Exception as e:
+                print("ADB home error:", e)
+
+
+async def open_and_navigate(task, config, ends):
+    serial, package = config.device.serial, task["package"]
+
+    # A deep link carrying pickup/drop can land straight on the fare screen
+    on_fare_screen = False
+    if task["deep_link"]:
+        destination = (task["params"] or {}).get("destination")
+        on_fare_screen = await open_deep_link(serial, task["deep_link"], package, task["extractor"], destination)
+        if not on_fare_screen:
+            print(f"Deep link into {package} did not reach the fare screen, entering addresses instead")
+
+    if package and not on_fare_screen and not await launch_app(serial, package):
+        print(f"{package} did not come to the front, leaving it to the agent")
+
+    return await navigate(task, config, ends, on_fare_screen)
+
+
+async def navigate(task, config, ends, on_fare_screen=False):
+    # Fetches with known addresses reach the fare screen through a deep link,
+    # the recorded macro, or else an agent run that is recorded for next time.
+    # The app's extractor then reads the screen; the agent is only asked to
+    # read it when the extractor is not confident. Without an extractor the
+    # agent reads the fares in the same run, as before.
+    goal, key, params = task["goal"], task["key"], task["params"]
+    package, extractor, fields = task["package"], task["extractor"], task["fields"]
+    serial = config.device.serial
+    if key is None or params is None or task["extract_goal"] is None:
+        return await run_task(goal, config, key, time_left(ends), package=package, fields=fields,
+                              vision=task["vision"])
+
+    timer = StepTimer()
+    via = []
+    name = macros.macro_name(key)
+    macro = macros.load(name)
+    if on_fare_screen:
+        via.append("deeplink")
+
+    if macro is not None and not on_fare_screen:
+        on_fare_screen = await macros.replay(serial, macro, params, extractor)
+        if on_fare_screen:
+            macros.replay_ok(name)
+            via.append("macro")
+        else:
+            print(f"Macro {name} did not verify, handing over to the agent")
+            macros.replay_failed(name)
+
+    if not on_fare_screen:
+        nav_only = extractor is not None and task["navigate_goal"] is not None
+        agent_goal = task["navigate_goal"] if nav_only else goal
+        started = time.time()
+        result = await run_task(agent_goal, config, key, time_left(ends), record=True, package=package,
+                                fields=() if nav_only else fields, vision=task["vision"])
+        if result["success"] if nav_only else is_good(result):
+            trajectory = macros.find_trajectory(agent_goal, started)
+            if trajectory is not None:
+                macros.record(name, trajectory, params)
+        if not nav_only or not result["success"]:
+            result["via"] = "agent"
+            return result
+        via.append("agent")
+
+    if extractor is not None:
+        try:
+            rows, confidence = await fare_extractor.read_fares(serial, extractor)
+        except (OSError, asyncio.TimeoutError) as e:
+            print("Fare extractor error:", e)
+            rows, confidence = [], 0.0
+        if rows and confidence >= fare_extractor.MIN_CONFIDENCE:
+            timing = timer.summary(0)
+            write_timing(key, serial, True, timing)
+            return {
+                "success": True,
+                "status": "ok",
+                "json": rows,
+                "raw_reason": json.dumps(rows),
+                "partial": False,
+                "missing_fields": missing_fields(rows, fields),
+                "timing": timing,
+                "via": "+".join(via + ["extractor"]),
+                "confidence": round(confidence, 2)
+            }
+        print(f"Extractor confidence {confidence:.2f} for {name}, asking the agent")
+
+    result = await run_task(task["extract_goal"], config, key, time_left(ends), package=package, fields=fields,
+                            vision=task["vision"])
+    result["via"] = "+".join(via + ["agent"])
+    return result
+
+
+async def resume_booking(task, config, ends):
+    # The fetch left this app on its fare screen on this device: bring it
+    # back, check the fares are still showing and only select and confirm.
+    # None means the screen was gone before anything was tapped, so the
+    # full booking goal can run.
+    serial, package = config.device.serial, task["package"]
+    try:
+        ready = await adb.launch(serial, package) and await fare_extractor.wait_for_fare_screen(
+            serial, RESUME_TIMEOUT, destination=task["resume"][3])
+    except (OSError, asyncio.TimeoutError) as e:
+        print("Resume error:", e)
+        ready = False
+    if not ready:
+        print(f"{package} is no longer on its fare screen, booking from the start")
+        return None
+
+    # Whatever the confirm run reports is final: it may have tapped Book
+    # before failing, and running the full goal could book a second ride
+    result = await run_task(task["resume_goal"], config, None, time_left(ends), package=package,
+                            vision=task["vision"])
+    result["via"] = "resume"
+    return result
+
+
+async def launch_app(serial, package):
+    # A device that drops or stalls here is left to the agent, not fatal
+    try:
+        return await adb.launch(serial, package)
+    except (OSError, asyncio.TimeoutError) as e:
+        print("App launch error:", e)
+        return False
+
+
+async def open_deep_link(serial, url, package, extractor=None, destination=None):
+    # Pickup/drop travel in the link; the screen read confirms fares for
+    # this destination loaded. The app is stopped first so it starts cold:
+    # a fare screen left from an earlier route (another session, or a fetch
+    # that was not parked) can pass that check when the link only carries
+    # coordinates.
+    try:
+        if package:
+            await adb.force_stop(serial, package)
+        await adb.open_url(serial, url, package)
+        return await fare_extractor.wait_for_fare_screen(serial, DEEP_LINK_TIMEOUT, extractor, destination)
+    except (OSError, asyncio.TimeoutError) as e:
+        print("Deep link error:", e)
+        return False
+
+
+async def stop_agent(handler, serial, package=None):
+    # Best effort: stop the workflow, force-stop the app it was stuck in and
+    # leave the device on the home screen so the next goal starts clean.
+    try:
+        if hasattr(handler, "cancel_run"):
+            await handler.cancel_run()
+        elif not handler.done():
+            handler.cancel()
+    except Exception as e:
+        print("Agent stop error:", e)
+
+    try:
+        if package:
+            await adb.force_stop(serial, package)
+        await adb.home(serial)
+    except Exception as e:
+        print("ADB home error:", e)
+
+
+# -----------------------------
+# Vision tiers
+# -----------------------------
+
+# Runs read the accessibility tree only, which is enough for most screens
+# and saves a screenshot upload per step. Apps whose screens do not read
+# as text start with vision; DROIDRUN_VISION=1 turns it on for every run.
+VISION_FORCED = os.getenv("DROIDRUN_VISION", "0") == "1"
+APP_VISION = {
+    "uber": False,
+    "ola": False,
+    "rapido": False,
+}
+VISION_MIN_REMAINING = 30     # seconds left for an escalated run to be worth it
+
+# Failure reasons that mean the agent could not see what it needed
+STUCK_MARKERS = ("stuck", "unable to", "could not", "couldn't", "cannot", "can't",
+                 "not find", "not visible", "no element", "not found", "max steps")
+
+
+def vision_for(app):
+    return APP_VISION.get(str(app).lower(), False) if app else False
+
+
+def with_vision(config, on):
+    # Every agent role that has a vision switch gets the same setting
+    config = copy.deepcopy(config)
+    agent = getattr(config, "agent", None)
+    for role in ("manager", "executor", "codeact"):
+        part = getattr(agent, role, None)
+        if part is not None and hasattr(part, "vision"):
+            part.vision = on
+    return config
+
+
+def is_stuck(result, config):
+    if result["status"] != "failed":
+        return False
+    max_steps = getattr(getattr(config, "agent", None), "max_steps", None)
+    steps = result["timing"].get("steps")
+    if max_steps and steps and steps >= max_steps:
+        return True
+    reason = str(result["raw_reason"] or "").lower()
+    return any(marker in reason for marker in STUCK_MARKERS)
+
+
+async def tree_is_empty(serial):
+    # No node with text or a description: nothing for a text-only agent
+    try:
+        nodes = adb.ui_nodes(await adb.dump_ui(serial))
+    except (OSError, asyncio.TimeoutError) as e:
+        print("UI dump error:", e)
+        return False
+    return not any(node["text"] or node["desc"] for node in nodes)
+
+
+# -----------------------------
+# Step timing
+# -----------------------------
+
+# Event class name fragments -> phase. Checked in order, first match wins.
+# In CodeAct mode (droidrun's default, reasoning=False) the LLM call sits
+# between CodeActInputEvent and CodeActResponseEvent, so those count as
+# think; "InputEvent" does not match InputTextActionEvent.
+PHASE_MARKERS = (
+    ("think", ("InputEvent", "ResponseEvent", "Plan", "Thinking", "Thought", "Reason", "LLM", "Manager")),
+    ("observe", ("Screenshot", "UIState", "UiState", "State", "Observ")),
+    ("act", ("Action", "Tap", "Swipe", "Input", "Key", "Execute", "Tool")),
+)
+
+
+def event_phase(event):
+    name = type(event).__name__
+    for phase, markers in PHASE_MARKERS:
+        if any(m in name for m in markers):
+            return phase
+    return "other"
+
+
+class StepTimer:
+    # The gap before each streamed event is charged to that event's phase.
+    # A think event that follows act/observe starts a new step.
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.phase = None
+        self.steps = []
+
+    def mark(self, event):
+        now = time.perf_counter()
+        phase = event_phase(event)
+        if not self.steps or (phase == "think" and self.phase not in (None, "think")):
+            self.steps.append({"think": 0.0, "act": 0.0, "observe": 0.0, "other": 0.0})
+        self.steps[-1][phase] += now - self.last
+        self.last = now
+        self.phase = phase
+
+    def summary(self, agent_steps=None):
+        end = time.perf_counter()
+        phases = {"think": 0.0, "act": 0.0, "observe": 0.0, "other": end - self.last}
+        for step in self.steps:
+            for phase, spent in step.items():
+                phases[phase] += spent
+
+        return {
+            "total_s": round(end - self.start, 3),
+            "steps": agent_steps if agent_steps is not None else len(self.steps),
+            "timed_steps": len(self.steps),
+            "phases": {k: round(v, 3) for k, v in phases.items()},
+            "per_step": [{k: round(v, 3) for k, v in step.items()} for step in self.steps],
+        }
+
+
+_timings_lock = threading.Lock()
+
+def write_timing(key, serial, success, timing):
+    record = {
+        "ts": time.time(),
+        "key": list(key) if key else None,
+        "device": serial,
+        "success": success,
+        **timing,
     }
+    try:
+        with _timings_lock, open(TIMINGS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print("Timing sink error:", e)
+
+
+# -----------------------------
+# Device pool
+# -----------------------------
+
+def configured_devices():
+    # DROIDRUN_DEVICES="emulator-5554,R58M123ABC" – empty means the single
+    # default ADB device, which is what DroidrunConfig() picks on its own.
+    raw = os.getenv("DROIDRUN_DEVICES", "")
+    serials = [s.strip() for s in raw.split(",") if s.strip()]
+    return serials or [None]
+
+
+class DevicePool:
+    # Leases one ADB device per goal. Only touched from the runner loop, so
+    # no locking; waiters are served strictly in arrival order.
+
+    def __init__(self, serials=()):
+        self.serials = []
+        self.idle = deque()
+        self.waiters = deque()
+        for serial in serials:
+            self.add(serial)
+
+    def add(self, serial):
+        if serial in self.serials:
+            return
+        self.serials.append(serial)
+        self.release(serial)
+
+    def size(self):
+        return len(self.serials)
+
+    async def acquire(self, prefer=None):
+        # `prefer` is taken when it is idle; any idle device otherwise
+        if self.idle and not self.waiters:
+            if prefer in self.idle:
+                self.idle.remove(prefer)
+                return prefer
+            return self.idle.popleft()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # Handed a device just as we were cancelled – pass it on.
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            raise
+
+    def try_acquire(self):
+        # Never jumps the queue: only hands out a device nobody is waiting for
+        if self.idle and not self.waiters:
+            return self.idle.popleft()
+        return None
+
+    def release(self, serial):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(serial)
+                return
+        self.idle.append(serial)
+
+    @asynccontextmanager
+    async def lease(self):
+        serial = await self.acquire()
+        try:
+            yield serial
+        finally:
+            self.release(serial)
+
+
+# -----------------------------
+# Single-flight
+# -----------------------------
+
+def flight_key(app, action, pickup, destination, category=None):
+    # Same route asked twice with different spacing/casing is the same run.
+    # A vehicle category narrows the run, so it becomes part of the key.
+    parts = (app, action, pickup, destination) + ((category,) if category else ())
+    return tuple(" ".join(str(part).lower().split()) for part in parts)
+
+
+# -----------------------------
+# Hedging
+# -----------------------------
+
+# Opt-in per app, e.g. SMARTCAB_HEDGE="uber,rapido". A hedged fetch that is
+# still running after the app's latency percentile is started again on a
+# second idle device; the first good result wins.
+HEDGE_APPS = {a.strip().lower() for a in os.getenv("SMARTCAB_HEDGE", "").split(",") if a.strip()}
+HEDGE_PERCENTILE = {
+    "uber": 0.9,
+    "ola": 0.9,
+    "rapido": 0.9,
+}
+HEDGE_DEFAULT_DELAY = 60      # seconds, until HEDGE_MIN_SAMPLES runs are known
+HEDGE_MIN_SAMPLES = 5
+HEDGE_BUDGET_RATIO = 0.1      # hedge device-seconds vs. normal device-seconds
+HEDGE_BUDGET_BURST = 120      # seconds of hedging allowed before any history
+LATENCY_WINDOW = 200
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load_latencies(path=TIMINGS_PATH):
+    # Seed per-app fetch latencies from the timing sink of earlier sessions
+    latencies = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = deque(f, maxlen=LATENCY_WINDOW * 5)
+    except OSError:
+        return latencies
+
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        key = record.get("key")
+        if record.get("success") and key and key[1] == "fetch":
+            latencies.setdefault(key[0], deque(maxlen=LATENCY_WINDOW)).append(record["total_s"])
+    return latencies
+
+
+# -----------------------------
+# Multi-app harvest
+# -----------------------------
+
+# On a single phone, one agent session visits every app in turn instead of
+# one DroidAgent run per app: no repeated agent start-up, no trips to the
+# home screen in between, and addresses typed once are picked from each
+# app's suggestions afterwards. A leg is one app's part of the run:
+# {"app", "key", "package", "navigate", "capture", "fields"}.
+
+def harvest_goal(legs):
+    names = [leg["app"] for leg in legs]
+    parts = [f"""
+Collect ride prices from {len(legs)} apps in one go: {", ".join(names)}.
+Visit them in this order. When an app is done, open the next one directly; do not go to the home screen in between.
+Pickup and destination are the same in every app. After typing them once, pick them from the app's recent or suggested locations (or paste them from the clipboard) instead of typing them again.
+"""]
+    for i, leg in enumerate(legs, 1):
+        # The first app is launched over ADB before the run; the rest are
+        # started by package through start_app, never found on the launcher
+        if i == 1:
+            opening = "It is already open."
+        else:
+            opening = f'Start it with start_app("{leg["package"]}"); do not look for its icon.'
+        parts.append(f"\nApp {i}: {leg['app']} (package {leg['package']}).\n{opening}\n")
+        parts.append(leg["navigate"] + leg["capture"])
+        parts.append(f"Record each {leg['app']} option as an object with the keys: {', '.join(leg['fields'])}.\n")
+
+    example = ", ".join(f'"{name}": [...]' for name in names)
+    parts.append(f"""
+If an app cannot show prices, use an empty array for it and move on.
+DO NOT use remember().
+When every app is done, return one JSON object keyed by app name, holding each app's array, as the reason in complete():
+{{{example}}}
+
+Return ONLY the JSON object text.
+""")
+    return "".join(parts)
+
+
+def split_harvest(result, legs):
+    # One combined result -> one result per app, shaped like run_task's
+    data = result["json"] if isinstance(result["json"], dict) else {}
+    by_name = {str(name).lower(): value for name, value in data.items()}
+    results = {}
+    for leg in legs:
+        records = by_name.get(leg["app"].lower())
+        # An empty array is the agent saying it could not read that app:
+        # a failed leg, so it is not cached or parked and is fetched alone
+        if not isinstance(records, list) or not records:
+            results[leg["app"]] = {
+                "success": False,
+                "status": "failed" if result["status"] == "ok" else result["status"],
+                "json": None,
+                "raw_reason": f"{leg['app']} missing or empty in harvest: {result['raw_reason']}",
+                "timing": result["timing"],
+                "via": "harvest",
+            }
+            continue
+        raw = json.dumps(records)
+        _, report = extract_json(raw, leg["fields"])
+        results[leg["app"]] = {
+            "success": result["success"],
+            "status": result["status"],
+            "json": records,
+            "raw_reason": raw,
+            "partial": False,
+            "missing_fields": report["missing"],
+            "timing": result["timing"],
+            "via": "harvest",
+        }
+    return results
+
+
+async def run_harvest(legs, config, key, deadline):
+    serial = config.device.serial
+    first = legs[0]["package"]
+    if first and not await launch_app(serial, first):
+        print(f"{first} did not come to the front, leaving it to the agent")
+    result = None
+    try:
+        vision = any(vision_for(leg["key"][0]) for leg in legs)
+        result = await run_task(harvest_goal(legs), config, key, deadline, vision=vision)
+    finally:
+        # Every app read fine stays on its fare screen for booking
+        if not (KEEP_FARE_SCREEN and result is not None and result["success"]):
+            try:
+                await adb.home(serial)
+            except Exception as e:
+                print("ADB home error:", e)
+
+    results = split_harvest(result, legs)
+    for app_result in results.values():
+        app_result["parked"] = KEEP_FARE_SCREEN and is_good(app_result)
+    return results
+
+
+# -----------------------------
+# Long-lived runner
+# -----------------------------
+
+class AgentRunner:
+    # One background event loop shared by every caller. Sync code (GUI
+    # threads, CLI) hands goals over with submit() and gets a
+    # concurrent.futures.Future back; each goal leases a device from the
+    # pool, so goals on different devices run at the same time.
+
+    def __init__(self, serials=None, cache=None):
+        self.loop = asyncio.new_event_loop()
+        self.pool = DevicePool(serials if serials is not None else configured_devices())
+        self.cache = cache if cache is not None else ResultCache()
+        self.configs = {}
+        self.inflight = {}
+        self.parked = {}
+        self.latencies = load_latencies()
+        self.device_seconds = 0.0
+        self.hedge_seconds = 0.0
+        self.thread = threading.Thread(target=self._run_loop, name="agent-runner", daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def config_for(self, serial):
+        config = self.configs.get(serial)
+        if config is None:
+            config = DroidrunConfig()
+            if serial is not None:
+                config.device.serial = serial
+            self.configs[serial] = config
+        return config
+
+    def add_device(self, serial):
+        self.loop.call_soon_threadsafe(self.pool.add, serial)
+
+    def unpark(self, package, serial):
+        # Any new run of an app on a device moves it off the parked screen
+        removed = False
+        for key, (parked_serial, parked_package, _) in list(self.parked.items()):
+            if parked_package == package and parked_serial == serial:
+                del self.parked[key]
+                removed = True
+        return removed
+
+    async def clear_parked(self, package, serial):
+        # A run that is not resuming the parked screen starts the app cold,
+        # so a deep link or launch cannot land on the old route's fares
+        if package and self.unpark(package, serial):
+            try:
+                await adb.force_stop(serial, package)
+            except (OSError, asyncio.TimeoutError) as e:
+                print("ADB force-stop error:", e)
+
+    def park(self, key, serial, package):
+        self.unpark(package, serial)
+        self.parked[key] = (serial, package, time.monotonic())
+
+    def parked_on(self, key):
+        # Taken out only when usable; a stale entry stays for clear_parked
+        parked = self.parked.get(key) if key is not None else None
+        if parked is None or time.monotonic() - parked[2] > PARK_MAX_AGE:
+            return None
+        return self.parked.pop(key)
+
+    async def _run_on_device(self, task):
+        # A booking goes to the device its fetch was parked on; anywhere
+        # else it runs the full goal.
+        parked = self.parked_on(task["resume"]) if task["resume_goal"] else None
+        serial = await self.pool.acquire(prefer=parked[0] if parked else None)
+        if task["resume_goal"] and (parked is None or serial != parked[0]):
+            if parked is not None:
+                self.parked[task["resume"]] = parked
+            task = dict(task, resume_goal=None)
+        return await self._run_leased(serial, task)
+
+    async def _run_leased(self, serial, task, hedge=False):
+        key = task["key"]
+        started = time.monotonic()
+        try:
+            await self.clear_parked(task["package"], serial)
+            result = await run_goal(task, self.config_for(serial))
+        finally:
+            self.pool.release(serial)
+            spent = time.monotonic() - started
+            if hedge:
+                self.hedge_seconds += spent
+            else:
+                self.device_seconds += spent
+
+        if key is not None and key[1] == "fetch" and result["status"] == "ok":
+            self.latencies.setdefault(key[0], deque(maxlen=LATENCY_WINDOW)).append(result["timing"]["total_s"])
+        if result.get("parked"):
+            self.park(key, serial, task["package"])
+        return result
+
+    def hedge_delay(self, app):
+        history = self.latencies.get(app) or ()
+        if len(history) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return percentile(history, HEDGE_PERCENTILE.get(app, 0.9))
+
+    def hedge_allowed(self):
+        return self.hedge_seconds < HEDGE_BUDGET_RATIO * self.device_seconds + HEDGE_BUDGET_BURST
+
+    async def _run_hedged(self, task):
+        primary = self.loop.create_task(self._run_on_device(task))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(task["key"][0]))
+            if done or not self.hedge_allowed():
+                return await primary
+
+            serial = self.pool.try_acquire()
+            if serial is None:
+                return await primary
+
+            tasks.add(self.loop.create_task(self._run_leased(serial, task, hedge=True)))
+            result = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.cancelled() or t.exception() is not None:
+                        continue
+                    result = t.result()
+                    if is_good(result):
+                        return result
+            return result if result is not None else primary.result()
+        finally:
+            # The loser is cancelled, which stops its agent and sends it home
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    async def _single_flight(self, task):
+        # Concurrent callers with the same key share one agent run. The run
+        # is only cancelled once every caller attached to it has gone away.
+        key = task["key"]
+        flight = self.inflight.get(key)
+        if flight is None:
+            flight = {"task": self.loop.create_task(self._run_and_store(task)), "waiters": 0}
+            self.inflight[key] = flight
+            flight["task"].add_done_callback(lambda _: self._land(key, flight))
+
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(flight["task"])
+        finally:
+            flight["waiters"] -= 1
+            if flight["waiters"] == 0 and not flight["task"].done():
+                flight["task"].cancel()
+
+    async def _run_and_store(self, task):
+        key = task["key"]
+        if key[1] == "fetch" and key[0] in HEDGE_APPS and self.pool.size() > 1:
+            result = await self._run_hedged(task)
+        else:
+            result = await self._run_on_device(task)
+
+        # Partly recovered output is returned but not cached
+        if key[1] == "fetch" and is_complete(result):
+            self.cache.put(key, result, ttl_for(key[0]))
+        return result
+
+    def _land(self, key, flight):
+        if self.inflight.get(key) is flight:
+            del self.inflight[key]
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit(self, goal: str, key=None, refresh=False, deadline=None, params=None, extract_goal=None,
+               package=None, go_home=False, navigate_goal=None, extractor=None, fields=(), deep_link=None,
+               resume=None, resume_goal=None):
+        # Cancelling the returned future stops the agent and frees the device.
+        # resume is the key of the fetch whose fare screen a booking may
+        # continue from with resume_goal.
+        task = {
+            "goal": goal,
+            "key": key,
+            "deadline": deadline or deadline_for(key),
+            "params": params,
+            "extract_goal": extract_goal,
+            "package": package,
+            "go_home": go_home,
+            "navigate_goal": navigate_goal,
+            "extractor": extractor,
+            "fields": fields,
+            "deep_link": deep_link,
+            "resume": resume,
+            "resume_goal": resume_goal,
+            "vision": vision_for(key[0] if key else resume[0] if resume else None),
+        }
+        if key is None:
+            return self.call(self._run_on_device(task))
+
+        # Fetch results are served from the disk cache unless refresh=True
+        if key[1] == "fetch" and not refresh:
+            hit = self.cache.get(key)
+            if hit is not None:
+                hit["cached"] = True
+                future = concurrent.futures.Future()
+                future.set_result(hit)
+                return future
+
+        return self.call(self._single_flight(task))
+
+    def run(self, goal: str, key=None, refresh=False, deadline=None, **options):
+        return self.submit(goal, key, refresh, deadline, **options).result()
+
+    async def _harvest(self, legs, key, deadline):
+        async with self.pool.lease() as serial:
+            for leg in legs:
+                await self.clear_parked(leg["package"], serial)
+            results = await run_harvest(legs, self.config_for(serial), key, deadline)
+        for leg in legs:
+            result = results[leg["app"]]
+            if result.get("parked"):
+                self.park(leg["key"], serial, leg["package"])
+            if is_complete(result):
+                self.cache.put(leg["key"], result, ttl_for(leg["key"][0]))
+        return results
+
+    def harvest(self, legs, pickup, destination, refresh=False, deadline=None):
+        # Returns {app: result}. Legs with a cached result are not visited.
+        results = {}
+        if not refresh:
+            for leg in legs:
+                hit = self.cache.get(leg["key"])
+                if hit is not None:
+                    hit["cached"] = True
+                    results[leg["app"]] = hit
+        todo = [leg for leg in legs if leg["app"] not in results]
+        if todo:
+            key = flight_key("harvest", "fetch", pickup, destination)
+            deadline = deadline or deadline_for(key) * len(todo)
+            results.update(self.call(self._harvest(todo, key, deadline)).result())
+        return results
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(adb.close_all)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = AgentRunner()
+        return _runner
+
+def submit_task(goal: str, key=None, refresh=False, deadline=None, **options):
+    return get_runner().submit(goal, key, refresh, deadline, **options)
+
+def run_task_sync(goal: str, key=None, refresh=False, deadline=None, **options):
+    return get_runner().run(goal, key, refresh, deadline, **options)
 
-def run_task_sync(goal: str):
-    return asyncio.run(run_task(goal))
+def harvest_sync(legs, pickup, destination, refresh=False, deadline=None):
+    return get_runner().harvest(legs, pickup, destination, refresh, deadline)
@@ -1,34 +1,64 @@
-from agent_runner import run_task_sync
+import providers
+from utils import parse_latlng
 
-def get_prices(pickup, destination):
-    goal = f"""
-Open Ola app.
+PACKAGE = "com.olacabs.customer"
+
+FIELDS = ("service", "price", "eta")
+SERVICES = ("Mini", "Prime Sedan", "Prime SUV", "Prime Plus", "Kaali Peeli",
+            "Auto", "Bike", "Electric", "Ola Electric")
+
+TIERS = {
+    "cab": ("Mini", "Prime Sedan", "Prime SUV", "Prime Plus", "Kaali Peeli"),
+    "auto": ("Auto",),
+    "bike": ("Bike",),
+}
+
+# Opens straight on the fare screen with pickup and drop filled in. Ola's
+# link only takes coordinates, so place names go through normal entry.
+DEEP_LINK = "olacabs://app/launch?lat={lat}&lng={lng}&drop_lat={drop_lat}&drop_lng={drop_lng}&category={category}"
+LINK_CATEGORIES = {"cab": "mini", "auto": "auto", "bike": "bike"}
+
+def deep_link(pickup, destination, vehicle_type=None):
+    start, drop = parse_latlng(pickup), parse_latlng(destination)
+    if not start or not drop:
+        return None
+    return DEEP_LINK.format(lat=start[0], lng=start[1], drop_lat=drop[0], drop_lng=drop[1],
+                            category=LINK_CATEGORIES.get(vehicle_type, "mini"))
+
+def fetch_goals(pickup, destination, vehicle_type=None):
+    navigate = f"""
+The Ola app is open.
 Set pickup location to "{pickup}".
 Set destination to "{destination}".
 Wait for price list.
-
+"""
+    tiers = TIERS.get(vehicle_type)
+    if tiers:
+        scope = f"""
+Extract only these options with price and ETA: {", ".join(tiers)}.
+Do not swipe for more options once they are captured."""
+    else:
+        scope = """
 Extract cab options with price and ETA. 
-Swipe up the area where price options are shown to load more options if available.
+Swipe up the area where price options are shown to load more options if available."""
+    capture = f"""{scope}
 
 Make sure all the details are extracted correctly, no missing fields or incorrect data.
+"""
+    return navigate, capture
+
 
+EXAMPLE = """
 Return JSON array like:
 [
-  {{"service":"Mini","price":200,"eta":7}}
+  {"service":"Mini","price":200,"eta":7}
 ]
-DO NOT use remember().
-Instead, return the JSON array directly as the reason in complete().
-
-After that, go to the Android home screen.
-
-Return ONLY the JSON array text.
 """
 
-    return run_task_sync(goal)
 
-def book_ride(pickup, destination, vehicle_type):
+def book_goals(pickup, destination, vehicle_type):
     goal = f"""
-Open Ola app.
+The Ola app is open.
 If pickup or destination is not set,
 Set pickup location to "{pickup}".
 Set destination to "{destination}".
@@ -46,4 +76,14 @@ Tap Book Ride.
 
 the ride should be booked.
 confirm booking everything should be managed by you."""
-    return run_task_sync(goal)
+    confirm = f"""
+The Ola fare screen for this trip is already open.
+Select the cheapest option among: {", ".join(TIERS.get(vehicle_type, ())) or vehicle_type}.
+Tap Book Ride.
+the ride should be booked."""
+
+    return goal, confirm
+
+
+providers.register_app("Ola", PACKAGE, FIELDS, SERVICES, TIERS, fetch_goals, EXAMPLE, book_goals,
+                       deep_link=deep_link)
@@ -1,8 +1,23 @@
-from agent_runner import run_task_sync
+import providers
 
-def get_prices(pickup, destination):
-    goal = f"""
-Open Rapido app.
+PACKAGE = "com.rapido.passenger"
+
+FIELDS = ("ride_type", "estimated_fare", "eta")
+SERVICES = ("Bike", "Bike Direct", "Bike Lite", "Auto", "Cab Economy",
+            "Cab Priority", "Cab Premium", "E-Rickshaw")
+
+TIERS = {
+    "cab": ("Cab Economy", "Cab Priority", "Cab Premium"),
+    "auto": ("Auto", "E-Rickshaw"),
+    "bike": ("Bike", "Bike Direct", "Bike Lite"),
+}
+
+# Rapido has no public deep link that carries pickup/drop, so it always
+# goes through address entry.
+
+def fetch_goals(pickup, destination, vehicle_type=None):
+    navigate = f"""
+The Rapido app is open.
 If pickup or destination is not set,
 Set pickup location to "{pickup}".
 Set destination to "{destination}".
@@ -10,26 +25,34 @@ and if already set, verify they are correct.
 if not correct, update them.
 
 Wait for price info.
-
+"""
+    tiers = TIERS.get(vehicle_type)
+    if tiers:
+        scope = f"""
+Extract only these ride options: {", ".join(tiers)}.
+Do not swipe for more options once they are captured."""
+    else:
+        scope = """
 Extract all ride options. 
-Swipe up the area where price options are shown to load more options if available.
+Swipe up the area where price options are shown to load more options if available."""
+    capture = scope + """
 
 Make sure all the details are extracted correctly, no missing fields or incorrect data.
+"""
+    return navigate, capture
 
-Return JSON array.
-DO NOT use remember().
-Instead, return the JSON array directly as the reason in complete().
-
-After that, go to the Android home screen.
 
-Return ONLY the JSON array text.
+EXAMPLE = """
+Return JSON array like:
+[
+  {"ride_type":"Bike","estimated_fare":"₹45","eta":"3 min"}
+]
 """
 
-    return run_task_sync(goal)
 
-def book_ride(pickup, destination, vehicle_type):
+def book_goals(pickup, destination, vehicle_type):
     goal = f"""
-Open Rapido app.
+The Rapido app is open.
 If pickup or destination is not set,
 Set pickup location to "{pickup}".
 Set destination to "{destination}".
@@ -48,4 +71,13 @@ Tap Book Ride.
 
 the ride should be booked.
 confirm booking everything should be managed by you."""
-    return run_task_sync(goal)
+    confirm = f"""
+The Rapido fare screen for this trip is already open.
+Select the cheapest option among: {", ".join(TIERS.get(vehicle_type, ())) or vehicle_type}.
+Tap Book Ride.
+the ride should be booked."""
+
+    return goal, confirm
+
+
+providers.register_app("Rapido", PACKAGE, FIELDS, SERVICES, TIERS, fetch_goals, EXAMPLE, book_goals)
@@ -1,46 +1,72 @@
-from agent_runner import run_task_sync
+from urllib.parse import quote
 
-def get_prices(pickup, destination):
-    goal = f"""
-    Open Uber app.
+import providers
+from utils import parse_latlng
+
+PACKAGE = "com.ubercab"
+
+FIELDS = ("service", "price", "eta")
+SERVICES = ("Uber Go", "Go Sedan", "Premier", "UberXL", "Uber XL", "Uber Green",
+            "Uber Auto", "Auto", "Moto", "Uber Moto", "Bike Saver")
+
+TIERS = {
+    "cab": ("Uber Go", "Go Sedan", "Premier", "UberXL", "Uber XL", "Uber Green"),
+    "auto": ("Uber Auto", "Auto"),
+    "bike": ("Moto", "Uber Moto", "Bike Saver"),
+}
+
+# Opens straight on the fare screen with pickup and drop filled in.
+# "lat,lng" input is sent as coordinates, anything else as place text.
+DEEP_LINK = "uber://?action=setPickup&{pickup}&{dropoff}"
+
+def place_param(role, text):
+    coords = parse_latlng(text)
+    if coords:
+        return f"{role}[latitude]={coords[0]}&{role}[longitude]={coords[1]}"
+    return f"{role}[formatted_address]={quote(str(text))}"
+
+def deep_link(pickup, destination, vehicle_type=None):
+    return DEEP_LINK.format(pickup=place_param("pickup", pickup), dropoff=place_param("dropoff", destination))
+
+def fetch_goals(pickup, destination, vehicle_type=None):
+    navigate = f"""
+    The Uber app is open.
     Set pickup location to "{pickup}".
     Set destination to "{destination}".
     Wait until price options are visible.
+    """
+    tiers = TIERS.get(vehicle_type)
+    if tiers:
+        scope = f"""
+    Only these options are needed: {", ".join(tiers)}.
+    Do not swipe for more options once they are captured.
+    Extract only those options with:"""
+    else:
+        scope = """
     Swipe up the area where price options are shown to load more options if available.
-    Extract all available cab options with:
+    Extract all available cab options with:"""
+    capture = f"""{scope}
     - service name
     - price in INR
     - ETA in minutes
     Make sure all the details are extracted correctly, no missing fields or incorrect data.
+    """
+    return navigate, capture
+
+
+EXAMPLE = """
     Create a JSON array like:
     [
-      {{"service":"Uber Go","price":325.14,"eta":2}},
-      {{"service":"Bike Saver","price":224.41,"eta":4}}
+      {"service":"Uber Go","price":325.14,"eta":2},
+      {"service":"Bike Saver","price":224.41,"eta":4}
     ]
 
-    DO NOT use remember().
-    Instead, return the JSON array directly as the reason in complete().
-
-    After that, go to the Android home screen.
-
-    Return ONLY the JSON array text.
     """
 
-    result = run_task_sync(goal)
-
-    if result["json"] is None:
-        return {
-            "error": "No JSON extracted",
-            "reason": result["reason"]
-        }
-
-    return result["json"]
-
 
-
-def book_ride(pickup, destination, vehicle_type):
+def book_goals(pickup, destination, vehicle_type):
     goal = f"""
-Open Uber app.
+The Uber app is open.
 If pickup or destination is not set,
 Set pickup location to "{pickup}".
 Set destination to "{destination}".
@@ -61,4 +87,14 @@ Tap Book or Confirm Ride button.
 the ride should be booked.
 confirm booking everything should be managed by you."""
 
-    return run_task_sync(goal)
+    confirm = f"""
+The Uber fare screen for this trip is already open.
+Select the cheapest option among: {", ".join(TIERS.get(vehicle_type, ())) or vehicle_type}.
+Tap Book or Confirm Ride button.
+the ride should be booked."""
+
+    return goal, confirm
+
+
+providers.register_app("Uber", PACKAGE, FIELDS, SERVICES, TIERS, fetch_goals, EXAMPLE, book_goals,
+                       deep_link=deep_link)
@@ -1,137 +1,441 @@
 # compareprices.py
+import asyncio
 import os
+import hashlib
 import json
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
 import google.generativeai as genai
 
+import providers
+from agent_runner import get_runner
+from result_cache import ResultCache
+from utils import extract_json
+from quotes import Quote, QuoteSet
+
 # Configure Gemini
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY"))
 
 MODEL_NAME = "models/gemini-1.0-pro"
   # fast & cheap
 
-def normalize_data(uber_data, ola_data, rapido_data, choice):
-    vehicle_map = {
-        "1": ["cab", "mini", "prime", "sedan", "economy", "xl", "go"],
-        "2": ["auto"],
-        "3": ["bike", "moto"]
-    }
-
-    keywords = vehicle_map.get(choice, [])
+# Vehicle choice from the GUI ("1" cab, "2" auto, "3" bike)
+CHOICE_CATEGORIES = {"1": "cab", "2": "auto", "3": "bike"}
+
+# Local scoring. Each option is scored against the cheapest price and the
+# shortest ETA on the table (1.0 = best on both); lower is better. Only
+# when another app's best option is within CLOSE_BAND of the winner is the
+# call handed to Gemini.
+PRICE_WEIGHT = float(os.getenv("SMARTCAB_PRICE_WEIGHT", "0.8"))
+ETA_WEIGHT = float(os.getenv("SMARTCAB_ETA_WEIGHT", "0.2"))
+CLOSE_BAND = float(os.getenv("SMARTCAB_CLOSE_BAND", "0.05"))
+# Close calls wait this long for Gemini before the local pick is used
+GEMINI_BUDGET = int(os.getenv("SMARTCAB_GEMINI_BUDGET_MS", "800")) / 1000
+
+ETA_PAD_S = 60            # keeps 1 min vs 2 min from counting as "twice as slow"
+
+# Gemini's answers for close calls are remembered per quote set, with
+# prices in ₹5 buckets and ETAs in whole minutes, in memory and on disk
+MEMO_TTL = int(os.getenv("SMARTCAB_MEMO_TTL", "3600"))
+MEMO_MAX = 256
+MEMO_PRICE_BUCKET = 500   # paise
+
+# compare_many packs close calls from many trips into one prompt per chunk
+BATCH_MAX_TOKENS = int(os.getenv("SMARTCAB_BATCH_MAX_TOKENS", "6000"))
+CHARS_PER_TOKEN = 4       # rough estimate, good enough for chunking
+BATCH_TIMEOUT = float(os.getenv("SMARTCAB_BATCH_TIMEOUT", "30"))
+
+def normalize_data(quote_sets, choice):
+    # quote_sets maps app name -> the QuoteSet its provider returned; the
+    # quotes are already parsed and categorised, so this only filters.
+    category = CHOICE_CATEGORIES.get(choice)
     normalized = []
 
-    # ---------- Uber ----------
-    if isinstance(uber_data, list):
-        for item in uber_data:
-            service = str(item.get("service", "")).lower()
-            if any(k in service for k in keywords):
-                normalized.append({
-                    "app": "Uber",
-                    "price": float(item.get("price", 99999)),
-                    "eta": int(item.get("eta", 999))
-                })
-
-    # ---------- Ola ----------
-    ola_list = []
-
-    if isinstance(ola_data, dict):
-        ola_list = ola_data.get("json") or []
-    elif isinstance(ola_data, list):
-        ola_list = ola_data
-
-    for item in ola_list:
-        if not isinstance(item, dict):
-            continue
+    for quote_set in quote_sets.values():
+        if isinstance(quote_set, QuoteSet):
+            normalized.extend(quote_set.for_category(category))
 
-        service = str(item.get("service", "")).lower()
-        if any(k in service for k in keywords):
-            normalized.append({
-                "app": "Ola",
-                "price": float(item.get("price", 99999)),
-                "eta": int(item.get("eta", 999))
-            })
+    return normalized
 
-    # ---------- Rapido ----------
-    rapido_list = []
+def candidate_apps(data):
+    # Apps that actually have an option on the table, in registry order
+    present = {q.app for q in data}
+    return [name for name in providers.names() if name in present] or sorted(present)
 
-    if isinstance(rapido_data, dict):
-        rapido_list = rapido_data.get("json") or []
-    elif isinstance(rapido_data, list):
-        rapido_list = rapido_data
+# One model per process: it holds the API client, so its connection is
+# reused across comparisons instead of being set up for every call.
+_model = None
+_model_lock = threading.Lock()
 
-    for item in rapido_list:
-        if not isinstance(item, dict):
-            continue
+def get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
 
-        service = str(item.get("ride_type", "")).lower()
-        if any(k in service for k in keywords):
-            price_raw = str(item.get("estimated_fare", "99999")).replace("₹", "").strip()
-            eta_raw = str(item.get("eta") or item.get("time") or "999")
 
-            try:
-                price = float(price_raw)
-            except:
-                price = 99999
+async def warm_up_async():
+    # A token count is the cheapest real request; it opens the connection
+    # the first comparison would otherwise pay for
+    try:
+        await get_model().count_tokens_async("ping")
+    except Exception as e:
+        print("Gemini warm-up error:", e)
 
-            try:
-                eta = int("".join(c for c in eta_raw if c.isdigit()))
-            except:
-                eta = 999
 
-            normalized.append({
-                "app": "Rapido",
-                "price": price,
-                "eta": eta
-            })
+def warm_up():
+    # Fire and forget on the runner loop, where ask_gemini_async runs
+    return get_runner().call(warm_up_async())
 
-    return normalized
 
-def ask_gemini(data):
-    prompt = f"""
+def build_prompt(data, apps):
+    return f"""
 You are given ride options from multiple cab apps.
 
 Data:
-{json.dumps(data, indent=2)}
+{json.dumps([q.as_dict() for q in data], indent=2)}
 
 Rules:
 - Prefer lowest price
 - If prices are close, prefer lower ETA
 
 Respond with ONLY ONE WORD:
-Uber OR Ola OR Rapido
+{" OR ".join(apps)}
 
 No explanation.
 """
 
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
 
-    text = response.text.strip()
+def parse_choice(text, apps):
+    text = text.strip().lower()
 
-    for app in ["Uber", "Ola", "Rapido"]:
-        if app.lower() in text.lower():
+    # Longest name first so one app's name inside another's does not match
+    for app in sorted(apps, key=len, reverse=True):
+        if app.lower() in text:
             return app
 
     return None
 
 
-def fallback_logic(data):
-    data.sort(key=lambda x: (x["price"], x["eta"]))
-    return data[0]["app"]
-
-
-def compare_and_choose(uber_data, ola_data, rapido_data, choice):
-    normalized = normalize_data(uber_data, ola_data, rapido_data, choice)
+async def ask_gemini_async(data):
+    # Runs on the agent runner's loop; the model's async client is bound
+    # to the loop it was first used on, so it always runs there
+    apps = candidate_apps(data)
+    response = await get_model().generate_content_async(build_prompt(data, apps))
+    return parse_choice(response.text, apps)
+
+
+def rank(data):
+    # [(score, quote)], best first
+    # An option without an ETA is scored as the slowest known one, so a
+    # missing ETA never costs more than the table's own spread
+    cheapest = min(q.price_paise for q in data) or 1
+    known = [q.eta_s for q in data if q.eta_s is not None]
+    fastest, slowest = min(known, default=0), max(known, default=0)
+    scored = []
+    for q in data:
+        eta = q.eta_s if q.eta_s is not None else slowest
+        score = (PRICE_WEIGHT * q.price_paise / cheapest
+                 + ETA_WEIGHT * (eta + ETA_PAD_S) / (fastest + ETA_PAD_S))
+        scored.append((score, q))
+    scored.sort(key=lambda item: (item[0], Quote.sort_key(item[1])))
+    return scored
+
+
+def close_options(ranked):
+    # The winner plus each other app's best option within the band of it.
+    # An option without an ETA is also close when its price alone is within
+    # the band of the winner's: its score only guesses at the ETA.
+    best_score, best = ranked[0]
+    close, seen = [], set()
+    for score, q in ranked:
+        if q.app in seen:
+            continue
+        near = score - best_score <= CLOSE_BAND * best_score
+        if near or (q.eta_s is None and q.price_paise <= best.price_paise * (1 + CLOSE_BAND)):
+            seen.add(q.app)
+            close.append(q)
+    return close
+
+
+def best_of(close, app):
+    return next(q for q in close if q.app == app)
+
+
+def log_late_answer(future, local_app, started, close, key):
+    # Usually runs on the runner's loop thread, so the memo's disk write
+    # goes to a thread of its own
+    if future.cancelled() or future.exception() is not None:
+        return
+    late = future.result()
+    if late not in candidate_apps(close):
+        return
+    # Too late for this booking, but the next identical call gets it
+    answer = {"app": late, "service": best_of(close, late).service}
+    threading.Thread(target=memo.put, args=(key, answer), daemon=True).start()
+    if late != local_app:
+        elapsed = time.monotonic() - started
+        print(f"Gemini disagreed after {elapsed:.2f}s: {late} vs local {local_app}")
+
+
+def rules_version():
+    # Any change to the weights, the band or the prompt starts a new memo
+    rules = [PRICE_WEIGHT, ETA_WEIGHT, CLOSE_BAND, ETA_PAD_S, MODEL_NAME, build_prompt([], [])]
+    return hashlib.sha256(json.dumps(rules).encode()).hexdigest()[:16]
+
+
+def memo_key(data, choice):
+    quotes = sorted(
+        [q.app, q.service, int(q.price_paise // MEMO_PRICE_BUCKET), q.eta_min if q.eta_min is not None else -1]
+        for q in data
+    )
+    canonical = json.dumps([choice, rules_version(), quotes], separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class DecisionMemo:
+    # Bounded LRU in front of a "decisions" table in the result cache file.
+    # Entries expire after MEMO_TTL either way.
+
+    def __init__(self, max_entries=MEMO_MAX, ttl=MEMO_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = None
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _disk(self):
+        if self.disk is None:
+            self.disk = ResultCache(table="decisions", max_entries=self.max_entries * 4)
+        return self.disk
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.entries.pop(key, None)
+
+        value = self._disk().get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, value, now)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value, time.time())
+        self._disk().put(key, value, self.ttl)
+
+    def _remember(self, key, value, now):
+        self.entries[key] = (now + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self.entries),
+            }
+
+
+memo = DecisionMemo()
+
+
+def decision(app, path, quote=None, margin=None):
+    return {"app": app, "path": path, "quote": quote, "margin": margin}
+
+
+def triage(quote_sets, choice):
+    # Everything that can be decided without Gemini. Returns
+    # (decision, close, best, margin, memo key); decision is None for a
+    # close call that still needs Gemini.
+    normalized = normalize_data(quote_sets, choice)
 
     if not normalized:
-        return "NoServiceFound"
-
+        return decision("NoServiceFound", "none"), None, None, None, None
+
+    ranked = rank(normalized)
+    best = ranked[0][1]
+    runner_up = next((score for score, q in ranked if q.app != best.app), None)
+    margin = None if runner_up is None else round(runner_up - ranked[0][0], 4)
+
+    close = close_options(ranked)
+    if len(close) < 2:
+        return decision(best.app, "local", best, margin), close, best, margin, None
+
+    key = memo_key(normalized, choice)
+    remembered = memo.get(key)
+    if remembered is not None and remembered["app"] in candidate_apps(close):
+        settled = decision(remembered["app"], "memo", best_of(close, remembered["app"]), margin)
+        return settled, close, best, margin, key
+
+    return None, close, best, margin, key
+
+
+def compare_and_choose(quote_sets, choice):
+    # Returns {"app", "path", "quote", "margin"}. path says what decided:
+    # "local" (clear winner), "gemini" (close call), "memo" (close call
+    # Gemini already answered for the same quotes), "local-timeout" (close
+    # call Gemini did not answer in budget), "local-fallback" (close call
+    # Gemini could not settle) or "none" (nothing to book).
+    settled, close, best, margin, key = triage(quote_sets, choice)
+    if settled is not None:
+        return settled
+
+    # Gemini gets GEMINI_BUDGET; the local pick is already known, so a
+    # slow answer only costs the budget, and is still checked when it lands
+    started = time.monotonic()
+    future = get_runner().call(ask_gemini_async(close))
     try:
-        gemini_choice = ask_gemini(normalized)
-        if gemini_choice in ["Uber", "Ola", "Rapido"]:
-            return gemini_choice
+        gemini_choice = future.result(timeout=GEMINI_BUDGET)
+        # Only an app that returned a matching option can win
+        if gemini_choice in candidate_apps(close):
+            quote = best_of(close, gemini_choice)
+            memo.put(key, {"app": gemini_choice, "service": quote.service})
+            return decision(gemini_choice, "gemini", quote, margin)
+    except FutureTimeout:
+        future.add_done_callback(lambda f: log_late_answer(f, best.app, started, close, key))
+        return decision(best.app, "local-timeout", best, margin)
     except Exception as e:
         print("Gemini error:", e)
 
     # Fallback
-    return fallback_logic(normalized)
+    return decision(best.app, "local-fallback", best, margin)
+
+
+# -----------------------------
+# Batch comparison
+# -----------------------------
+
+def build_batch_prompt(chunk):
+    trips = [{"trip": trip_id, "options": [q.as_dict() for q in close]} for trip_id, close in chunk]
+    return f"""
+You are given ride options from multiple cab apps for several trips.
+Pick one app for each trip.
+
+Trips:
+{json.dumps(trips, indent=1)}
+
+Rules:
+- Prefer lowest price
+- If prices are close, prefer lower ETA
+- Only pick an app listed in that trip's options
+
+Respond with ONLY a JSON array with one entry per trip, like:
+[{{"trip": "{chunk[0][0]}", "app": "{chunk[0][1][0].app}"}}]
+
+No explanation.
+"""
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_trips(pending):
+    # Greedy packing so each prompt stays under BATCH_MAX_TOKENS
+    overhead = estimate_tokens(build_batch_prompt(pending[:1])) - estimate_tokens(
+        json.dumps([q.as_dict() for q in pending[0][1]]))
+    chunks, chunk, used = [], [], overhead
+    for trip_id, close in pending:
+        size = estimate_tokens(json.dumps({"trip": trip_id, "options": [q.as_dict() for q in close]}, indent=1))
+        if chunk and used + size > BATCH_MAX_TOKENS:
+            chunks.append(chunk)
+            chunk, used = [], overhead
+        chunk.append((trip_id, close))
+        used += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def ask_gemini_batch(chunk):
+    # {trip_id: app} for the trips Gemini answered with a valid app
+    response = await get_model().generate_content_async(build_batch_prompt(chunk))
+    answers, _ = extract_json(response.text, ("trip", "app"))
+    closes = dict(chunk)
+    choices = {}
+    for item in answers if isinstance(answers, list) else ():
+        if not isinstance(item, dict) or str(item.get("trip")) not in closes:
+            continue
+        trip_id = str(item["trip"])
+        # Same rule as a single comparison: only an app with an option counts
+        app = parse_choice(str(item.get("app", "")), candidate_apps(closes[trip_id]))
+        if app is not None:
+            choices[trip_id] = app
+    return choices
+
+
+async def ask_gemini_batches(pending):
+    # All chunks go out at once; a failed chunk just answers nothing
+    answers = await asyncio.gather(*(ask_gemini_batch(chunk) for chunk in chunk_trips(pending)),
+                                   return_exceptions=True)
+    choices = {}
+    for answer in answers:
+        if isinstance(answer, Exception):
+            print("Gemini batch error:", answer)
+        else:
+            choices.update(answer)
+    return choices
+
+
+def compare_many(trips):
+    # trips: [{"id", "quote_sets", "choice"}] ("id" defaults to the index).
+    # Returns {id: decision} like compare_and_choose's; the close calls of
+    # all trips go to Gemini in as few requests as the token limit allows.
+    decisions, pending, context, order = {}, [], {}, []
+    for index, trip in enumerate(trips):
+        trip_id = str(trip.get("id", index))
+        order.append(trip_id)
+        settled, close, best, margin, key = triage(trip["quote_sets"], trip["choice"])
+        if settled is not None:
+            decisions[trip_id] = settled
+            continue
+        pending.append((trip_id, close))
+        context[trip_id] = (best, margin, key)
+
+    if not pending:
+        return decisions
+
+    future = get_runner().call(ask_gemini_batches(pending))
+    try:
+        choices = future.result(timeout=BATCH_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        print("Gemini batch timed out after", BATCH_TIMEOUT, "s")
+        choices = {}
+    except Exception as e:
+        print("Gemini batch error:", e)
+        choices = {}
+
+    # Trips Gemini left out (or whose chunk failed) get the local pick
+    for trip_id, close in pending:
+        best, margin, key = context[trip_id]
+        app = choices.get(trip_id)
+        if app is None:
+            decisions[trip_id] = decision(best.app, "local-fallback", best, margin)
+            continue
+        quote = best_of(close, app)
+        memo.put(key, {"app": app, "service": quote.service})
+        decisions[trip_id] = decision(app, "gemini-batch", quote, margin)
+
+    return {trip_id: decisions[trip_id] for trip_id in order}
@@ -0,0 +1,159 @@
+# fare_extractor.py
+# Reads fare options straight from a uiautomator dump of an app's fare
+# screen. Each app supplies its own service names and output field names;
+# rows are built by pairing every service label with the nearest price and
+# ETA text on the same line of the list.
+
+import asyncio
+import re
+import time
+
+import adb
+from utils import parse_latlng
+
+PRICE_RE = re.compile(r"₹\s*([\d,]+(?:\.\d{1,2})?)")
+ETA_RE = re.compile(r"(\d+)\s*(?:mins?|minutes?)\b", re.I)
+
+MIN_CONFIDENCE = 0.8
+
+READY_TIMEOUT = 20      # seconds to wait for the fare screen
+READY_MARKERS = ("₹",)  # the fare screen shows at least one rupee price
+
+
+def parse_price(text):
+    m = PRICE_RE.search(text)
+    return float(m.group(1).replace(",", "")) if m else None
+
+
+def parse_eta(text):
+    m = ETA_RE.search(text)
+    return int(m.group(1)) if m else None
+
+
+def label(node):
+    return node["text"] or node["desc"]
+
+
+def match_service(text, services):
+    # Longest name first, so "Uber Auto" is not read as "Auto"
+    lowered = text.strip().lower()
+    for name in sorted(services, key=len, reverse=True):
+        if lowered == name.lower() or lowered.startswith(name.lower() + " ") or lowered.startswith(name.lower() + ","):
+            return name
+    return None
+
+
+def nearest(nodes, anchor, parse, used):
+    # Closest unused node (by vertical distance) on the anchor's row
+    x1, y1, x2, y2 = anchor["bounds"]
+    height = max(y2 - y1, 1)
+    best, best_value, best_dist = None, None, None
+    for node in nodes:
+        if id(node) in used or node is anchor:
+            continue
+        value = parse(label(node))
+        if value is None:
+            continue
+        cy = (node["bounds"][1] + node["bounds"][3]) / 2
+        if not (y1 - height <= cy <= y2 + 2 * height):
+            continue
+        dist = abs(cy - (y1 + y2) / 2)
+        if best_dist is None or dist < best_dist:
+            best, best_value, best_dist = node, value, dist
+    if best is not None:
+        used.add(id(best))
+    return best_value
+
+
+def extract(xml, services, fields=("service", "price", "eta")):
+    # Returns (rows, confidence). A row needs a service and a price; a
+    # missing ETA costs confidence, a service with no price costs more.
+    service_key, price_key, eta_key = fields
+    nodes = adb.ui_nodes(xml)
+    rows = []
+    seen = set()
+    used = set()
+    score = 0.0
+
+    for node in nodes:
+        name = match_service(label(node), services)
+        if name is None or name in seen:
+            continue
+        seen.add(name)
+
+        # Some apps put the whole row in one content description
+        price = parse_price(label(node))
+        if price is None:
+            price = nearest(nodes, node, parse_price, used)
+        eta = parse_eta(label(node))
+        if eta is None:
+            eta = nearest(nodes, node, parse_eta, used)
+
+        if price is None:
+            continue
+        row = {service_key: name, price_key: price}
+        if eta is not None:
+            row[eta_key] = eta
+        rows.append(row)
+        score += 1.0 if eta is not None else 0.6
+
+    if not seen:
+        return [], 0.0
+    return rows, score / len(seen)
+
+
+def merge(*row_lists, key="service"):
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            merged.setdefault(row[key], row)
+    return list(merged.values())
+
+
+async def screen_size(serial):
+    m = re.search(r"(\d+)x(\d+)", await adb.shell(serial, "wm size"))
+    return (int(m.group(1)), int(m.group(2))) if m else (1080, 2400)
+
+
+async def read_fares(serial, extractor):
+    # Read the visible options, pull the fare panel up once and read again
+    rows, confidence = extractor(await adb.dump_ui(serial))
+    if not rows:
+        return rows, confidence
+
+    width, height = await screen_size(serial)
+    await adb.swipe(serial, width // 2, int(height * 0.8), width // 2, int(height * 0.45), 400)
+    more, more_confidence = extractor(await adb.dump_ui(serial))
+
+    if more:
+        confidence = min(confidence, more_confidence)
+    return merge(rows, more, key=next(iter(rows[0]))), confidence
+
+
+def shows_destination(xml, destination):
+    # Coordinates are never shown as typed, so they cannot be checked
+    if not destination or parse_latlng(destination):
+        return True
+    wanted = " ".join(str(destination).split(",")[0].lower().split())
+    return any(wanted in " ".join(label(node).lower().split()) for node in adb.ui_nodes(xml))
+
+
+def is_fare_screen(xml, extractor=None, destination=None):
+    # With the app's extractor, its own service labels must show a price;
+    # a bare ₹ could be the previous route's screen still on display
+    if extractor is not None:
+        ready = bool(extractor(xml)[0])
+    else:
+        ready = any(marker in xml for marker in READY_MARKERS)
+    return ready and shows_destination(xml, destination)
+
+
+async def wait_for_fare_screen(serial, timeout=READY_TIMEOUT, extractor=None, destination=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        xml = await adb.dump_ui(serial)
+        if is_fare_screen(xml, extractor, destination):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.6)
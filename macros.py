@@ -0,0 +1,192 @@
+# macros.py
+# Record-and-replay of the fixed navigation part of an app workflow.
+#
+# A successful agent run saves its actions as trajectories/<run>/macro.json
+# (DroidRun's own format). We keep the steps up to the destination being
+# picked, swap the typed pickup/destination for placeholders and store the
+# result per app under macros/. Next time the steps are replayed straight
+# over ADB with the new addresses, each tap checked against the screen
+# first; the agent only takes over when a step cannot be verified.
+
+import asyncio
+import json
+import os
+import time
+
+import adb
+import fare_extractor
+
+MACRO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "macros")
+TRAJECTORY_DIR = os.getenv("DROIDRUN_TRAJECTORIES", "trajectories")
+
+STEP_TIMEOUT = 8        # seconds to wait for a tap target to show up
+SETTLE_DELAY = 0.6      # seconds between steps for the UI to catch up
+MAX_FAILURES = 3        # failed replays in a row before a macro is dropped
+
+_failures = {}
+
+
+def macro_name(key):
+    return f"{key[0]}_{key[1]}"
+
+
+def macro_path(name):
+    return os.path.join(MACRO_DIR, name + ".json")
+
+
+def load(name):
+    try:
+        with open(macro_path(name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def discard(name):
+    _failures.pop(name, None)
+    try:
+        os.remove(macro_path(name))
+    except OSError:
+        pass
+
+
+def replay_ok(name):
+    _failures.pop(name, None)
+
+
+def replay_failed(name):
+    # A macro that keeps failing (app update, changed layout) costs every
+    # fetch a wasted replay; drop it so the next agent run records afresh
+    _failures[name] = _failures.get(name, 0) + 1
+    if _failures[name] >= MAX_FAILURES:
+        print(f"Macro {name} failed {MAX_FAILURES} times in a row, discarding it")
+        discard(name)
+
+
+# ---------- Recording ----------
+
+def find_trajectory(goal, since):
+    # Newest macro.json written after `since` for `goal`. Runs on other
+    # devices write here too, so a trajectory for another goal never counts
+    candidates = []
+    try:
+        entries = list(os.scandir(TRAJECTORY_DIR))
+    except OSError:
+        return None
+
+    for entry in entries:
+        path = os.path.join(entry.path, "macro.json")
+        if entry.is_dir() and os.path.exists(path) and os.path.getmtime(path) >= since:
+            candidates.append(path)
+    candidates.sort(key=os.path.getmtime, reverse=True)
+
+    for path in candidates:
+        try:
+            with open(path, encoding="utf-8") as f:
+                if json.load(f).get("description", "").strip() == goal.strip():
+                    return path
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def action_type(action):
+    return action.get("action_type") or action.get("type") or ""
+
+
+def parameterize(text, params):
+    # Replace recorded addresses with {name} placeholders
+    lowered = str(text).lower()
+    for name, value in params.items():
+        value = str(value).strip().lower()
+        if value and value in lowered:
+            start = lowered.index(value)
+            return text[:start] + "{" + name + "}" + text[start + len(value):], name
+    return text, None
+
+
+def record(name, trajectory_path, params):
+    try:
+        with open(trajectory_path, encoding="utf-8") as f:
+            actions = json.load(f).get("actions") or []
+    except (OSError, ValueError):
+        return False
+
+    steps = []
+    filled = set()
+    for action in actions:
+        step = dict(action)
+        kind = action_type(action)
+        if kind == "input_text":
+            step["text"], used = parameterize(action.get("text", ""), params)
+            filled.add(used)
+        elif kind == "tap" and action.get("element_text"):
+            step["element_text"], _ = parameterize(action["element_text"], params)
+        steps.append(step)
+
+        # Navigation ends with the tap that picks the last address
+        if kind == "tap" and filled >= set(params):
+            break
+
+    # Only worth keeping if both addresses were typed (not picked from history)
+    if not filled >= set(params):
+        return False
+
+    os.makedirs(MACRO_DIR, exist_ok=True)
+    with open(macro_path(name), "w", encoding="utf-8") as f:
+        json.dump({"name": name, "recorded_at": time.time(), "steps": steps}, f, indent=2)
+    return True
+
+
+# ---------- Replay ----------
+
+async def wait_for_node(serial, text, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        node = adb.find_node(adb.ui_nodes(await adb.dump_ui(serial)), text)
+        if node is not None or time.monotonic() >= deadline:
+            return node
+        await asyncio.sleep(SETTLE_DELAY)
+
+
+async def play_step(serial, step, params):
+    kind = action_type(step)
+
+    if kind == "tap":
+        target = step.get("element_text")
+        if target:
+            node = await wait_for_node(serial, target.format(**params), STEP_TIMEOUT)
+            if node is None:
+                return False
+            await adb.tap(serial, *adb.center(node))
+        else:
+            await adb.tap(serial, step["x"], step["y"])
+    elif kind == "input_text":
+        await adb.input_text(serial, step.get("text", "").format(**params))
+    elif kind in ("swipe", "drag"):
+        await adb.swipe(serial, step["start_x"], step["start_y"], step["end_x"], step["end_y"],
+                        step.get("duration_ms", 300))
+    elif kind == "key_press":
+        await adb.keyevent(serial, step["keycode"])
+    elif kind == "back":
+        await adb.keyevent(serial, "KEYCODE_BACK")
+    elif kind == "start_app":
+        if not await adb.launch(serial, step["package"]):
+            return False
+    # anything else (waits, screenshots) needs no device action
+
+    await asyncio.sleep(SETTLE_DELAY)
+    return True
+
+
+async def replay(serial, macro, params, extractor=None):
+    # True when every step verified and the target screen came up
+    try:
+        for step in macro["steps"]:
+            if not await play_step(serial, step, params):
+                return False
+        return await fare_extractor.wait_for_fare_screen(serial, extractor=extractor,
+                                                         destination=params.get("destination"))
+    except (KeyError, ValueError, OSError, asyncio.TimeoutError) as e:
+        print("Macro replay error:", e)
+        return False
@@ -1,15 +1,17 @@
 # SmartCab AI – Professional GUI (Tkinter + ttk)
 # Now with:
-# 1) Live incremental updates per app (Uber → Ola → Rapido)
+# 1) Live updates per app as each fetch finishes (one tab per registered provider)
 # 2) Integrated Logs tab inside the results section
 # Works with your existing logic (apps/, compareprices.py, agent_runner.py)
 
 import threading
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tkinter import ttk, messagebox
 
-from apps import uber, ola, rapido
-from compareprices import compare_and_choose
+import providers
+from quotes import QuoteSet
+from compareprices import compare_and_choose, warm_up
 
 
 # -----------------------------
@@ -60,12 +62,19 @@ class SmartCabApp:
         self.dest_var = tk.StringVar()
         self.vehicle_var = tk.StringVar(value="cab")
 
-        self.uber_data = None
-        self.ola_data = None
-        self.rapido_data = None
+        # One tab, table and QuoteSet per registered app
+        self.providers = providers.load()
+        self.tables = {}
+        self.quotes = {}
+        # (pickup, destination, vehicle) the shown quotes were fetched for;
+        # compare and book use it, not whatever the form says by then
+        self.trip = None
 
         self.build_ui()
 
+        # Open the Gemini connection while the user types the trip
+        warm_up()
+
     # ---------------- UI -----------------
 
     def build_ui(self):
@@ -124,9 +133,8 @@ class SmartCabApp:
         self.tabs = ttk.Notebook(right)
         self.tabs.pack(fill="both", expand=True, padx=12, pady=(0, 12))
 
-        self.uber_tab = self.create_table_tab("Uber")
-        self.ola_tab = self.create_table_tab("Ola")
-        self.rapido_tab = self.create_table_tab("Rapido")
+        for provider in self.providers:
+            self.tables[provider.name] = self.create_table_tab(provider.name)
         self.logs_tab = self.create_logs_tab()
 
         # Bottom actions
@@ -150,8 +158,7 @@ class SmartCabApp:
             tree.column(c, anchor="center")
 
         tree.pack(fill="both", expand=True, padx=8, pady=8)
-        setattr(self, f"{name.lower()}_table", tree)
-        return frame
+        return tree
 
     def create_logs_tab(self):
         frame = ttk.Frame(self.tabs)
@@ -181,17 +188,16 @@ class SmartCabApp:
         for i in table.get_children():
             table.delete(i)
 
-    def fill_table(self, table, data, key_service="service"):
+    def fill_table(self, table, quote_set):
         self.clear_table(table)
-        if not data:
+        if quote_set is not None and quote_set.error:
+            table.insert("", "end", values=("Error", quote_set.error, "-"))
             return
-        for item in data:
-            if not isinstance(item, dict):
-                continue
-            service = item.get(key_service) or item.get("ride_type") or "-"
-            price = item.get("price") or item.get("estimated_fare") or "-"
-            eta = item.get("eta") or item.get("time") or "-"
-            table.insert("", "end", values=(service, price, eta))
+        if not quote_set:
+            return
+        for quote in quote_set:
+            eta = quote.eta_min if quote.eta_min is not None else "-"
+            table.insert("", "end", values=(quote.service, f"{quote.price:.2f}", eta))
 
     # ---------------- Logic -----------------
 
@@ -207,49 +213,74 @@ class SmartCabApp:
         self.book_btn.config(state="disabled")
         self.set_status("Fetching prices…")
         self.log("Starting price fetch…")
+        for table in self.tables.values():
+            self.clear_table(table)
 
         self.progress.start(10)
 
         threading.Thread(target=self.fetch_prices_incremental, daemon=True).start()
 
     def fetch_prices_incremental(self):
-        try:
-            # Uber
-            self.log("Fetching Uber prices…")
-            self.uber_data = uber.get_prices(self.pickup_var.get(), self.dest_var.get())
-            self.root.after(0, lambda: self.update_single_table("uber"))
-
-            # Ola
-            self.log("Fetching Ola prices…")
-            self.ola_data = ola.get_prices(self.pickup_var.get(), self.dest_var.get())
-            self.root.after(0, lambda: self.update_single_table("ola"))
+        # All providers start at once (the runner spreads them over the
+        # devices it has); each table fills in as its fetch finishes and a
+        # failing app only marks its own tab.
+        pickup, dest, vehicle = self.pickup_var.get(), self.dest_var.get(), self.vehicle_var.get()
+        self.quotes = {}
+        self.trip = (pickup, dest, vehicle)
+
+        if providers.use_harvest(self.providers):
+            self.fetch_prices_harvest(pickup, dest, vehicle)
+            return
 
-            # Rapido
-            self.log("Fetching Rapido prices…")
-            self.rapido_data = rapido.get_prices(self.pickup_var.get(), self.dest_var.get())
-            self.root.after(0, lambda: self.update_single_table("rapido"))
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.providers) or 1) as pool:
+                futures = {}
+                for provider in self.providers:
+                    self.root.after(0, self.log, f"Fetching {provider.name} prices…")
+                    futures[pool.submit(provider.get_quotes, pickup, dest, vehicle)] = provider.name
+
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        self.quotes[name] = future.result()
+                    except Exception as e:
+                        self.quotes[name] = QuoteSet(name, error=str(e))
+                    self.root.after(0, self.update_single_table, name)
 
             self.root.after(0, self.finish_fetching)
         except Exception as e:
-            self.root.after(0, lambda: self.on_error(str(e)))
+            # e is unbound once the except block ends; pass the message
+            self.root.after(0, self.on_error, str(e))
+
+    def fetch_prices_harvest(self, pickup, dest, vehicle):
+        # One phone: a single agent session visits every app in turn
+        self.root.after(0, self.log, "Single device – fetching all apps in one agent session…")
+        try:
+            self.quotes = providers.harvest(self.providers, pickup, dest, vehicle)
+        except Exception as e:
+            self.quotes = {p.name: QuoteSet(p.name, error=str(e)) for p in self.providers}
+
+        for name in self.quotes:
+            self.root.after(0, self.update_single_table, name)
+        self.root.after(0, self.finish_fetching)
 
     def update_single_table(self, app_name):
-        if app_name == "uber":
-            self.fill_table(self.uber_table, self.uber_data, "service")
-            self.log("Uber prices updated in UI")
-        elif app_name == "ola":
-            ola_list = self.ola_data.get("json") if isinstance(self.ola_data, dict) else self.ola_data
-            self.fill_table(self.ola_table, ola_list, "service")
-            self.log("Ola prices updated in UI")
-        elif app_name == "rapido":
-            rapido_list = self.rapido_data.get("json") if isinstance(self.rapido_data, dict) else self.rapido_data
-            self.fill_table(self.rapido_table, rapido_list, "ride_type")
-            self.log("Rapido prices updated in UI")
+        quote_set = self.quotes.get(app_name)
+        self.fill_table(self.tables[app_name], quote_set)
+        if quote_set is not None and quote_set.error:
+            self.log(f"{app_name}: {quote_set.error}")
+        else:
+            self.log(f"{app_name} prices updated in UI")
 
     def finish_fetching(self):
         self.progress.stop()
-        self.set_status("Prices fetched successfully")
-        self.log("All prices fetched successfully")
+        failed = [name for name, quote_set in self.quotes.items() if quote_set.error]
+        if failed:
+            self.set_status(f"Prices fetched ({', '.join(failed)} failed)", warn=True)
+            self.log("Price fetch finished with errors: " + ", ".join(failed))
+        else:
+            self.set_status("Prices fetched successfully")
+            self.log("All prices fetched successfully")
         self.book_btn.config(state="normal")
         self.next_btn.config(state="normal")
 
@@ -262,19 +293,34 @@ class SmartCabApp:
 
     def compare_and_book(self):
         type_map = {"cab": "1", "auto": "2", "bike": "3"}
-        choice = type_map[self.vehicle_var.get()]
+        pickup, dest, vehicle = self.trip
+        choice = type_map[vehicle]
+        if vehicle != self.vehicle_var.get():
+            # Never book a category other than the one now selected
+            msg = f"Prices were fetched for {vehicle}. Fetch again to compare {self.vehicle_var.get()} options."
+            self.progress.stop()
+            self.set_status("Vehicle type changed", warn=True)
+            self.log(msg)
+            messagebox.showwarning("Vehicle type changed", msg)
+            self.book_btn.config(state="normal")
+            return
 
         # UI feedback immediately
-        self.set_status("Comparing using Gemini…")
-        self.log("Comparing options using Gemini…")
+        self.set_status("Comparing options…")
+        self.log("Comparing options…")
         self.progress.start(10)
         self.book_btn.config(state="disabled")
 
         def compare_task():
-            winner = compare_and_choose(self.uber_data, self.ola_data, self.rapido_data, choice)
+            try:
+                result = compare_and_choose(self.quotes, choice)
+            except Exception as e:
+                self.root.after(0, compare_failed, str(e))
+                return
+            winner = result["app"]
 
             def after_compare():
-                if winner == "NoServiceFound":
+                if result["path"] == "none":
                     self.progress.stop()
                     self.set_status("No suitable service found", warn=True)
                     self.log("No suitable service found")
@@ -283,7 +329,7 @@ class SmartCabApp:
 
                 # Show selected app immediately
                 self.set_status(f"Selected: {winner}")
-                self.log(f"Best option selected: {winner}")
+                self.log(f"Best option selected: {winner} ({result['quote']}, decided by {result['path']})")
 
                 # Switch to logs tab automatically
                 self.tabs.select(self.logs_tab)
@@ -296,22 +342,34 @@ class SmartCabApp:
 
             self.root.after(0, after_compare)
 
+        def compare_failed(msg):
+            self.progress.stop()
+            self.set_status("Comparison failed", warn=True)
+            self.log("Comparison error: " + msg)
+            self.book_btn.config(state="normal")
+
         def booking_task(winner):
             # Heavy / blocking automation here
-            if winner == "Uber":
-                res = uber.book_ride(self.pickup_var.get(), self.dest_var.get(), self.vehicle_var.get())
-            elif winner == "Ola":
-                res = ola.book_ride(self.pickup_var.get(), self.dest_var.get(), self.vehicle_var.get())
-            elif winner == "Rapido":
-                res = rapido.book_ride(self.pickup_var.get(), self.dest_var.get(), self.vehicle_var.get())
-            else:
-                res = None
+            provider = providers.get(winner)
+            try:
+                if provider is not None:
+                    res = provider.book(pickup, dest, vehicle)
+                else:
+                    res = None
+            except Exception as e:
+                res = {"success": False, "status": "error", "raw_reason": str(e)}
 
             def after_booking():
                 self.progress.stop()
                 if res is None:
                     self.set_status("Booking failed", warn=True)
                     self.log("Booking failed")
+                elif not res["success"]:
+                    # Timeouts and failed runs come back as results, not None
+                    status = "timed out" if res["status"] == "timeout" else "failed"
+                    self.set_status(f"Booking {status}", warn=True)
+                    self.log(f"Booking on {winner} {status}: {res.get('raw_reason')}")
+                    messagebox.showerror("Booking " + status, f"Booking on {winner} {status}.\n{res.get('raw_reason') or ''}")
                 else:
                     self.set_status("Booking initiated successfully ✓")
                     self.log("Booking initiated successfully")
@@ -0,0 +1,167 @@
+# providers.py
+# Registry of ride-hailing apps. Each app module registers its fetch/book
+# callables, the field names its raw rows use and its vehicle-category
+# tiers when imported. The GUI tabs, dispatch and quote normalization all
+# iterate over this registry, so adding an app is a new module under apps/
+# plus an entry in SMARTCAB_PROVIDERS. Apps the agent drives declare only
+# their data and goal text and go through register_app.
+
+import importlib
+import os
+
+import agent_runner
+import fare_extractor
+import quotes
+
+BUILTIN = ("apps.uber", "apps.ola", "apps.rapido")
+
+
+class Provider:
+    __slots__ = ("name", "fetch", "book", "goals", "fields", "tiers", "package")
+
+    def __init__(self, name, fetch, book, goals, fields, tiers, package):
+        self.name = name
+        self.fetch = fetch
+        self.book = book
+        self.goals = goals
+        self.fields = fields
+        self.tiers = tiers
+        self.package = package
+
+    def get_quotes(self, pickup, destination, vehicle_type=None, refresh=False):
+        # Raw agent/extractor result -> QuoteSet, using this app's schema
+        result = self.fetch(pickup, destination, vehicle_type, refresh)
+        return quotes.from_result(self.name, result, self.fields, self.tiers)
+
+    def __repr__(self):
+        return f"Provider({self.name!r})"
+
+
+_registry = {}
+
+
+def register(name, fetch, book, goals=None, fields=("service", "price", "eta"), tiers=None, package=None):
+    # goals(pickup, destination, vehicle_type) -> (navigate, capture) lets
+    # the app join a multi-app harvest; apps without it are fetched alone
+    provider = Provider(name, fetch, book, goals, tuple(fields), tiers or {}, package)
+    _registry[name] = provider
+    return provider
+
+
+def register_app(name, package, fields, services, tiers, fetch_goals, example, book_goals, deep_link=None):
+    # fetch/book for an app the agent drives, built from its declarations:
+    #   fields     keys of a price row, also used by the fare extractor
+    #   services   every option label the fare screen can show
+    #   tiers      {"cab"|"auto"|"bike": labels}, matching the GUI's choice
+    #   fetch_goals(pickup, destination, vehicle_type) -> (navigate, capture):
+    #              reaching the fare screen, and what to read off it
+    #   example    the JSON array to answer with when fetched on its own
+    #              (a harvest asks for one object covering every app)
+    #   book_goals(pickup, destination, vehicle_type) -> (goal, confirm):
+    #              the full booking, and the one run straight from the fare
+    #              screen a fetch left open
+    #   deep_link(pickup, destination, vehicle_type) -> URL or None
+    slug = name.lower()
+
+    def link(pickup, destination, vehicle_type):
+        return deep_link(pickup, destination, vehicle_type) if deep_link else None
+
+    def fetch(pickup, destination, vehicle_type=None, refresh=False):
+        navigate, capture = fetch_goals(pickup, destination, vehicle_type)
+        labels = tiers.get(vehicle_type) or services
+        extract = capture + example + agent_runner.RETURN_ARRAY
+        return agent_runner.run_task_sync(
+            navigate + extract,
+            key=agent_runner.flight_key(slug, "fetch", pickup, destination, vehicle_type),
+            refresh=refresh,
+            params={"pickup": pickup, "destination": destination},
+            package=package,
+            go_home=True,
+            navigate_goal=navigate + "Once the prices are visible, finish with complete(). Do not extract anything.\n",
+            extractor=lambda xml: fare_extractor.extract(xml, labels, fields),
+            fields=fields,
+            deep_link=link(pickup, destination, vehicle_type),
+            extract_goal=f"The {name} prices are already visible on screen.\n" + extract,
+        )
+
+    def book(pickup, destination, vehicle_type):
+        goal, confirm = book_goals(pickup, destination, vehicle_type)
+        return agent_runner.run_task_sync(
+            goal,
+            package=package,
+            deep_link=link(pickup, destination, vehicle_type),
+            resume=agent_runner.flight_key(slug, "fetch", pickup, destination, vehicle_type),
+            resume_goal=confirm,
+        )
+
+    return register(name, fetch, book, goals=fetch_goals, fields=fields, tiers=tiers, package=package)
+
+
+def get(name):
+    return _registry.get(name)
+
+
+def all_providers():
+    return list(_registry.values())
+
+
+def names():
+    return list(_registry)
+
+
+def load(modules=None):
+    # Import the app modules (which register themselves); registration
+    # order is the order tabs and fetches use.
+    if modules is None:
+        raw = os.getenv("SMARTCAB_PROVIDERS", "")
+        modules = [m.strip() for m in raw.split(",") if m.strip()] or BUILTIN
+    for module in modules:
+        importlib.import_module(module)
+    return all_providers()
+
+
+# Harvest on a single device only with SMARTCAB_HARVEST=1: the combined
+# run skips deep links, macros, the fare extractor and single-flight
+HARVEST = os.getenv("SMARTCAB_HARVEST", "0") == "1"
+
+
+def use_harvest(chosen):
+    joinable = [p for p in chosen if p.goals is not None]
+    return HARVEST and len(joinable) > 1 and agent_runner.get_runner().pool.size() == 1
+
+
+def harvest(chosen, pickup, destination, vehicle_type=None, refresh=False):
+    # One agent session for every app that can join; apps it could not
+    # cover (or that cannot join) are then fetched on their own.
+    legs = []
+    for provider in chosen:
+        if provider.goals is None:
+            continue
+        navigate, capture = provider.goals(pickup, destination, vehicle_type)
+        legs.append({
+            "app": provider.name,
+            "key": agent_runner.flight_key(provider.name, "fetch", pickup, destination, vehicle_type),
+            "package": provider.package,
+            "navigate": navigate,
+            "capture": capture,
+            "fields": provider.fields,
+        })
+
+    try:
+        results = agent_runner.harvest_sync(legs, pickup, destination, refresh) if legs else {}
+    except Exception as e:
+        print("Harvest error:", e)
+        results = {}
+
+    quote_sets = {}
+    for provider in chosen:
+        result = results.get(provider.name)
+        if result is not None and agent_runner.is_good(result):
+            quote_sets[provider.name] = quotes.from_result(provider.name, result, provider.fields, provider.tiers)
+            continue
+        # One app failing on its own must not cost the others their quotes
+        try:
+            quote_sets[provider.name] = provider.get_quotes(pickup, destination, vehicle_type, refresh)
+        except Exception as e:
+            quote_sets[provider.name] = quotes.QuoteSet(provider.name, error=str(e))
+    return quote_sets
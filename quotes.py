@@ -0,0 +1,135 @@
+# quotes.py
+# Fixed-layout fare records. Raw agent/extractor rows become Quotes once, at
+# the provider boundary (Provider.get_quotes); everything after that (GUI
+# tables, normalization, Gemini, fallback) reads validated fields instead of
+# re-parsing "₹" strings and per-app key names.
+
+import re
+import time
+
+# Service-name keywords per vehicle category, checked in this order
+CATEGORY_KEYWORDS = (
+    ("bike", ("bike", "moto")),
+    ("auto", ("auto", "rickshaw")),
+    ("cab", ("cab", "mini", "prime", "sedan", "economy", "xl", "go", "premier", "peeli")),
+)
+
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def category_of(service, tiers=None):
+    # The app's own tier lists win; keywords cover names they do not list
+    name = str(service).lower()
+    for category, names in (tiers or {}).items():
+        if name in (n.lower() for n in names):
+            return category
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(k in name for k in keywords):
+            return category
+    return None
+
+
+def parse_paise(value):
+    # 325.14, "325.14", "₹1,124" -> paise; None when there is no number
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(round(value * 100))
+    m = NUMBER_RE.search(str(value or "").replace(",", ""))
+    return int(round(float(m.group()) * 100)) if m else None
+
+
+def parse_eta_s(value):
+    # 3, "3 min", "3-5 mins" -> seconds (first number, in minutes)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value * 60)
+    m = NUMBER_RE.search(str(value or ""))
+    return int(float(m.group()) * 60) if m else None
+
+
+class Quote:
+    __slots__ = ("app", "service", "category", "price_paise", "eta_s", "fetched_at")
+
+    def __init__(self, app, service, category, price_paise, eta_s, fetched_at):
+        self.app = app
+        self.service = service
+        self.category = category
+        self.price_paise = price_paise
+        self.eta_s = eta_s
+        self.fetched_at = fetched_at
+
+    @property
+    def price(self):
+        return self.price_paise / 100
+
+    @property
+    def eta_min(self):
+        return None if self.eta_s is None else self.eta_s // 60
+
+    def sort_key(self):
+        return (self.price_paise, self.eta_s if self.eta_s is not None else 999 * 60)
+
+    def as_dict(self):
+        return {"app": self.app, "service": self.service, "price": self.price, "eta": self.eta_min}
+
+    def __repr__(self):
+        return f"Quote({self.app!r}, {self.service!r}, ₹{self.price:.2f}, eta={self.eta_min})"
+
+
+class QuoteSet:
+    # All quotes one app returned for one fetch, or the error in their place
+    __slots__ = ("app", "quotes", "error", "fetched_at", "cached")
+
+    def __init__(self, app, quotes=(), error=None, fetched_at=None, cached=False):
+        self.app = app
+        self.quotes = tuple(quotes)
+        self.error = error
+        self.fetched_at = fetched_at or time.time()
+        self.cached = cached
+
+    def __iter__(self):
+        return iter(self.quotes)
+
+    def __len__(self):
+        return len(self.quotes)
+
+    def for_category(self, category):
+        return [q for q in self.quotes if q.category == category]
+
+    def cheapest(self, category=None):
+        quotes = self.for_category(category) if category else self.quotes
+        return min(quotes, key=Quote.sort_key, default=None)
+
+    def __repr__(self):
+        if self.error:
+            return f"QuoteSet({self.app!r}, error={self.error!r})"
+        return f"QuoteSet({self.app!r}, {list(self.quotes)!r})"
+
+
+def from_records(app, records, fields=("service", "price", "eta"), tiers=None, fetched_at=None):
+    # Raw rows -> Quotes; rows without a service name or price are dropped
+    service_key, price_key, eta_key = fields
+    fetched_at = fetched_at or time.time()
+    quotes = []
+    for item in records or ():
+        if not isinstance(item, dict):
+            continue
+        service = item.get(service_key)
+        price_paise = parse_paise(item.get(price_key))
+        if not service or price_paise is None:
+            continue
+        eta = item.get(eta_key)
+        if eta is None:
+            eta = item.get("time")
+        quotes.append(Quote(app, str(service), category_of(service, tiers), price_paise, parse_eta_s(eta), fetched_at))
+    return quotes
+
+
+def from_result(app, result, fields=("service", "price", "eta"), tiers=None):
+    # An agent_runner result -> QuoteSet
+    records = result.get("json")
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list):
+        reason = result.get("raw_reason")
+        error = f"No JSON extracted: {reason}" if reason else "No JSON extracted"
+        return QuoteSet(app, error=error, cached=bool(result.get("cached")))
+    return QuoteSet(app, from_records(app, records, fields, tiers), cached=bool(result.get("cached")))
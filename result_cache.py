@@ -0,0 +1,82 @@
+# result_cache.py
+# Single-file SQLite store for agent results, so a route priced a minute ago
+# is answered from disk instead of driving the phone again. Survives restarts.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.getenv("SMARTCAB_CACHE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "smartcab_cache.sqlite3"
+)
+MAX_ENTRIES = int(os.getenv("SMARTCAB_CACHE_MAX", "500"))
+
+# Seconds a fetched price list stays valid, per app
+APP_TTLS = {
+    "uber": 120,
+    "ola": 120,
+    "rapido": 180,
+}
+DEFAULT_TTL = 120
+
+
+def ttl_for(app):
+    return APP_TTLS.get(str(app).lower(), DEFAULT_TTL)
+
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_PATH, max_entries=MAX_ENTRIES, table="results"):
+        self.max_entries = max_entries
+        self.table = table
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_used ON {table} (used_at)")
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    def get(self, key):
+        k = self._key(key)
+        now = time.time()
+        with self.lock, self.db:
+            row = self.db.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (k,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (k,))
+                return None
+            self.db.execute(f"UPDATE {self.table} SET used_at = ? WHERE key = ?", (now, k))
+        return json.loads(row[0])
+
+    def put(self, key, value, ttl):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (self._key(key), json.dumps(value), now + ttl, now),
+            )
+            # LRU: keep only the most recently used max_entries rows
+            self.db.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, key):
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (self._key(key),))
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM {self.table}")
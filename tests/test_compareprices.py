@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("droidrun")
+pytest.importorskip("google.generativeai")
+
+import compareprices
+from quotes import Quote
+
+
+def quote(app, service, price, eta_min=None):
+    return Quote(app, service, "cab", int(price * 100), None if eta_min is None else eta_min * 60, 0)
+
+
+def test_memo_key_buckets_prices_and_ignores_order():
+    a = [quote("Uber", "Uber Go", 201, 3), quote("Ola", "Mini", 210, 4)]
+    b = [quote("Ola", "Mini", 212.5, 4), quote("Uber", "Uber Go", 203.99, 3)]
+    assert compareprices.memo_key(a, "1") == compareprices.memo_key(b, "1")
+    assert compareprices.memo_key(a, "1") != compareprices.memo_key(a, "2")
+
+
+def test_memo_key_with_missing_eta():
+    known = [quote("Uber", "Uber Go", 200, 0), quote("Ola", "Mini", 201, 3)]
+    unknown = [quote("Uber", "Uber Go", 200), quote("Ola", "Mini", 201, 3)]
+    assert compareprices.memo_key(unknown, "1") != compareprices.memo_key(known, "1")
+
+
+def test_missing_eta_is_a_close_call_not_a_loss():
+    ranked = compareprices.rank([quote("Uber", "Uber Go", 200), quote("Ola", "Mini", 201, 3)])
+    close = compareprices.close_options(ranked)
+    assert {q.app for q in close} == {"Uber", "Ola"}
+
+
+def test_clear_winner_on_price_and_eta():
+    ranked = compareprices.rank([quote("Uber", "Uber Go", 200, 3), quote("Ola", "Mini", 300, 9)])
+    assert ranked[0][1].app == "Uber"
+    assert [q.app for q in compareprices.close_options(ranked)] == ["Uber"]
+
+
+def test_chunk_trips_respects_the_token_limit(monkeypatch):
+    pending = [(str(i), [quote("Uber", "Uber Go", 200 + i, 3), quote("Ola", "Mini", 201 + i, 4)])
+               for i in range(20)]
+    monkeypatch.setattr(compareprices, "BATCH_MAX_TOKENS", 400)
+    chunks = compareprices.chunk_trips(pending)
+    assert len(chunks) > 1
+    assert [trip_id for chunk in chunks for trip_id, _ in chunk] == [str(i) for i in range(20)]
+    for chunk in chunks:
+        assert compareprices.estimate_tokens(compareprices.build_batch_prompt(chunk)) <= 400
+
+    monkeypatch.setattr(compareprices, "BATCH_MAX_TOKENS", 100000)
+    assert len(compareprices.chunk_trips(pending)) == 1
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("droidrun")
+
+from agent_runner import event_phase
+
+
+def make_event(name):
+    return type(name, (), {})()
+
+
+@pytest.mark.parametrize("name, phase", [
+    # droidrun 0.4.22 CodeAct events (default, reasoning=False)
+    ("CodeActInputEvent", "think"),
+    ("CodeActResponseEvent", "think"),
+    ("CodeActExecuteEvent", "act"),
+    # Manager/executor events (reasoning=True)
+    ("ManagerInputEvent", "think"),
+    ("ManagerPlanEvent", "think"),
+    ("ExecutorInputEvent", "think"),
+    ("ExecutorResponseEvent", "think"),
+    ("TaskThinkingEvent", "think"),
+    # Device actions and observations
+    ("TapActionEvent", "act"),
+    ("SwipeActionEvent", "act"),
+    ("InputTextActionEvent", "act"),
+    ("KeyPressActionEvent", "act"),
+    ("ScreenshotEvent", "observe"),
+    ("RecordUIStateEvent", "observe"),
+])
+def test_event_phase(name, phase):
+    assert event_phase(make_event(name)) == phase
+
+
+def test_unknown_event_is_other():
+    assert event_phase(make_event("SomethingElse")) == "other"
@@ -0,0 +1,62 @@
+import pytest
+
+from utils import extract_json
+
+FIELDS = ("service", "price", "eta")
+
+
+def test_plain_array():
+    data, report = extract_json('[{"service":"Mini","price":200,"eta":7}]', FIELDS)
+    assert data == [{"service": "Mini", "price": 200, "eta": 7}]
+    assert report == {"partial": False, "missing": []}
+
+
+@pytest.mark.parametrize("text", [
+    'Here are the prices:\n```json\n[{"service":"Mini","price":200,"eta":7}]\n```',
+    '```\n[{"service":"Mini","price":200,"eta":7}]\n```',
+    'I found these options [{"service":"Mini","price":200,"eta":7}] on the screen.',
+])
+def test_array_in_fences_or_prose(text):
+    data, report = extract_json(text, FIELDS)
+    assert data == [{"service": "Mini", "price": 200, "eta": 7}]
+    assert not report["partial"]
+
+
+def test_truncated_array_keeps_complete_records():
+    text = '[{"service":"Mini","price":200,"eta":7},{"service":"Prime Sedan","price":2'
+    data, report = extract_json(text, FIELDS)
+    assert data == [{"service": "Mini", "price": 200, "eta": 7}]
+    assert report["partial"]
+
+
+def test_closed_array_beats_truncated_one():
+    text = 'draft [{"service":"Mini"}, {"serv\nfinal [{"service":"Mini","price":200,"eta":7}]'
+    data, report = extract_json(text, FIELDS)
+    assert data == [{"service": "Mini", "price": 200, "eta": 7}]
+    assert not report["partial"]
+
+
+def test_keyed_object_is_the_answer():
+    text = 'Done: {"Uber": [{"service":"Uber Go","price":120,"eta":3}], "Ola": []}'
+    data, _ = extract_json(text)
+    assert data == {"Uber": [{"service": "Uber Go", "price": 120, "eta": 3}], "Ola": []}
+
+
+def test_loose_objects():
+    text = '{"service":"Mini","price":200,"eta":7}\n{"service":"Auto","price":90,"eta":2}'
+    data, _ = extract_json(text, FIELDS)
+    assert [row["service"] for row in data] == ["Mini", "Auto"]
+
+
+def test_missing_fields_are_reported():
+    text = '[{"service":"Mini","price":200},{"service":"Auto","price":"","eta":2}]'
+    data, report = extract_json(text, FIELDS)
+    assert len(data) == 2
+    assert report["missing"] == [[0, ["eta"]], [1, ["price"]]]
+
+
+@pytest.mark.parametrize("text", ["", None, "no prices were visible"])
+def test_nothing_to_recover(text):
+    data, report = extract_json(text, FIELDS)
+    assert data is None
+    assert report == {"partial": False, "missing": []}
@@ -0,0 +1,73 @@
+import pytest
+
+import fare_extractor
+
+SERVICES = ("Uber Go", "Go Sedan", "Uber Auto", "Auto", "Moto")
+
+
+def node(text, top, left=0, desc=""):
+    return (f'<node text="{text}" content-desc="{desc}" resource-id="" '
+            f'bounds="[{left},{top}][{left + 400},{top + 60}]" />')
+
+
+def dump(*nodes):
+    return '<?xml version="1.0" ?><hierarchy>' + "".join(nodes) + "</hierarchy>"
+
+
+def test_rows_pair_labels_with_price_and_eta_on_the_same_line():
+    xml = dump(
+        node("Uber Go", 1000), node("3 min away", 1040), node("₹ 250.50", 1000, left=700),
+        node("Go Sedan", 1200), node("5 mins", 1240), node("₹1,020", 1200, left=700),
+    )
+    rows, confidence = fare_extractor.extract(xml, SERVICES)
+    assert rows == [
+        {"service": "Uber Go", "price": 250.5, "eta": 3},
+        {"service": "Go Sedan", "price": 1020.0, "eta": 5},
+    ]
+    assert confidence == 1.0
+
+
+def test_longest_service_name_wins():
+    xml = dump(node("Uber Auto", 1000), node("₹ 90", 1000, left=700), node("2 min", 1040))
+    rows, _ = fare_extractor.extract(xml, SERVICES)
+    assert [row["service"] for row in rows] == ["Uber Auto"]
+
+
+def test_whole_row_in_content_description():
+    xml = dump(node("", 1000, desc="Moto, 4 min away, ₹ 64"))
+    rows, confidence = fare_extractor.extract(xml, SERVICES)
+    assert rows == [{"service": "Moto", "price": 64.0, "eta": 4}]
+    assert confidence == 1.0
+
+
+def test_missing_eta_costs_confidence_and_omits_the_field():
+    xml = dump(node("Uber Go", 1000), node("₹ 250", 1000, left=700))
+    rows, confidence = fare_extractor.extract(xml, SERVICES)
+    assert rows == [{"service": "Uber Go", "price": 250.0}]
+    assert confidence < fare_extractor.MIN_CONFIDENCE
+
+
+def test_service_without_price_is_dropped():
+    xml = dump(node("Uber Go", 1000), node("₹ 250", 1000, left=700), node("3 min", 1040), node("Go Sedan", 1400))
+    rows, confidence = fare_extractor.extract(xml, SERVICES)
+    assert [row["service"] for row in rows] == ["Uber Go"]
+    assert confidence == 0.5
+
+
+def test_custom_field_names():
+    xml = dump(node("Auto", 1000), node("₹45", 1000, left=700), node("3 min", 1040))
+    rows, _ = fare_extractor.extract(xml, SERVICES, ("ride_type", "estimated_fare", "eta"))
+    assert rows == [{"ride_type": "Auto", "estimated_fare": 45.0, "eta": 3}]
+
+
+@pytest.mark.parametrize("xml", ["", "not xml", dump(node("Welcome back", 100))])
+def test_no_fare_screen(xml):
+    assert fare_extractor.extract(xml, SERVICES) == ([], 0.0)
+
+
+def test_fare_screen_needs_the_destination():
+    xml = dump(node("Airport  T1, Terminal Rd", 200), node("Uber Go", 1000), node("₹ 250", 1000, left=700))
+    extractor = lambda x: fare_extractor.extract(x, SERVICES)
+    assert fare_extractor.is_fare_screen(xml, extractor, "airport t1, Bengaluru")
+    assert not fare_extractor.is_fare_screen(xml, extractor, "MG Road")
+    assert fare_extractor.is_fare_screen(xml, extractor, "12.97, 77.59")
@@ -0,0 +1,50 @@
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_round_trip_with_tuple_keys(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "c.sqlite"))
+    cache.put(("uber", "fetch", "a", "b"), {"json": [1, 2]}, 60)
+    assert cache.get(("uber", "fetch", "a", "b")) == {"json": [1, 2]}
+    assert cache.get(("ola", "fetch", "a", "b")) is None
+
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "c.sqlite"))
+    cache.put("k", "v", 60)
+    clock[0] += 59
+    assert cache.get("k") == "v"
+    clock[0] += 1
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "c.sqlite"), max_entries=2)
+    cache.put("a", 1, 60)
+    clock[0] += 1
+    cache.put("b", 2, 60)
+    clock[0] += 1
+    assert cache.get("a") == 1
+    clock[0] += 1
+    cache.put("c", 3, 60)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_tables_are_separate(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite")
+    results, decisions = ResultCache(path), ResultCache(path, table="decisions")
+    results.put("k", "result", 60)
+    assert decisions.get("k") is None
+    results.invalidate("k")
+    assert results.get("k") is None
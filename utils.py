@@ -0,0 +1,132 @@
+# utils.py
+import json
+import re
+
+FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S | re.I)
+LATLNG_RE = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+_decoder = json.JSONDecoder()
+
+
+def _skip(text, i, chars=" \t\r\n"):
+    while i < len(text) and text[i] in chars:
+        i += 1
+    return i
+
+
+def _scan_array(text, start):
+    # Decode an array element by element from the "[" at `start`. Stops at
+    # the first element that does not parse (e.g. output cut off mid-record)
+    # and returns what was complete, plus whether the array was closed.
+    items = []
+    i = _skip(text, start + 1)
+    while i < len(text):
+        if text[i] == "]":
+            return items, True
+        try:
+            item, i = _decoder.raw_decode(text, i)
+        except ValueError:
+            break
+        items.append(item)
+        i = _skip(text, i, " \t\r\n,")
+    return items, False
+
+
+def _scan_objects(text):
+    # Every top-level {...} that parses on its own, in order
+    objects = []
+    i = text.find("{")
+    while i != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, i)
+        except ValueError:
+            i = text.find("{", i + 1)
+            continue
+        if isinstance(obj, dict):
+            objects.append(obj)
+        i = text.find("{", end)
+    return objects
+
+
+def _scan_container(text):
+    # An object that opens before any array and holds lists/objects (e.g.
+    # {"Uber": [...], "Ola": [...]}) is the answer itself, not a wrapper
+    # around the first array inside it.
+    obj_at, arr_at = text.find("{"), text.find("[")
+    if obj_at == -1 or (arr_at != -1 and arr_at < obj_at):
+        return None
+    try:
+        obj, _ = _decoder.raw_decode(text, obj_at)
+    except ValueError:
+        return None
+    if isinstance(obj, dict) and any(isinstance(v, (list, dict)) for v in obj.values()):
+        return obj
+    return None
+
+
+def extract_json(text, required=()):
+    # Pull the records out of an agent's free-text reason: plain JSON, JSON
+    # in code fences or prose, an object keyed by app, an array truncated
+    # mid-record, or loose objects. Returns (data, report); data is None when nothing could be
+    # recovered. report["partial"] is set when the array was cut short and
+    # report["missing"] lists [index, [fields]] for records lacking any of
+    # the `required` fields.
+    report = {"partial": False, "missing": []}
+    if not text:
+        return None, report
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if not isinstance(data, (list, dict)):
+        data = None
+
+    if data is None:
+        fenced = FENCE_RE.search(text)
+        body = fenced.group(1) if fenced else text
+        data = _scan_container(body)
+
+    if data is None:
+        # Closed arrays beat truncated ones, then the most records wins
+        best, best_rank = None, None
+        i = body.find("[")
+        while i != -1:
+            items, closed = _scan_array(body, i)
+            rank = (closed, sum(isinstance(x, dict) for x in items), len(items))
+            if items and (best is None or rank > best_rank):
+                best, best_rank = items, rank
+            i = body.find("[", i + 1)
+
+        if best is not None:
+            data = best
+            report["partial"] = not best_rank[0]
+        else:
+            objects = _scan_objects(body)
+            data = objects or None
+
+    report["missing"] = missing_fields(data, required)
+    return data, report
+
+
+def missing_fields(data, required=()):
+    # [index, [fields]] for each record lacking any of the required fields
+    found = []
+    if isinstance(data, list) and required:
+        for index, item in enumerate(data):
+            if isinstance(item, dict):
+                missing = [f for f in required if item.get(f) in (None, "")]
+                if missing:
+                    found.append([index, missing])
+    return found
+
+
+def parse_latlng(text):
+    # "12.9716, 77.5946" -> (12.9716, 77.5946); anything else -> None
+    m = LATLNG_RE.match(str(text or ""))
+    if not m:
+        return None
+    lat, lng = float(m.group(1)), float(m.group(2))
+    if -90 <= lat <= 90 and -180 <= lng <= 180:
+        return lat, lng
+    return None